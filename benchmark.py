@@ -0,0 +1,293 @@
+import argparse
+import random
+import timeit
+from copy import deepcopy
+from queue import PriorityQueue
+
+import numpy as np
+
+from tiltmp.core.algorithms import (
+    breadth_first_distance,
+    clear_distance_cache,
+    compute_distances,
+)
+from tiltmp.core.gridcreation import random_cave_board, random_maze_board
+from tiltmp.core.gridutil import direct_neighbors
+from tiltmp.core.instance_creation import random_instance
+from tiltmp.core.openlist import BucketQueue, OpenList
+from tiltmp.core.serialization import read_instance
+from tiltmp.core.tumbletiles import Polyomino, Tile
+from tiltmp.mp.motionplanner import get_motion_planner
+from tiltmp.mp.nodestore import CHECKPOINT_INTERVAL, DeltaNodeStore
+
+BOARD_TYPES = {"maze": random_maze_board, "cave": random_cave_board}
+
+# size of the target shape, leftover tiles, glue types and whether a seed tile is fixed
+# of the random instances of the replay benchmark, one for each set of pruners that
+# get_motion_planner adds
+REPLAY_INSTANCES = [
+    (5, 0, 3, False),
+    (4, 4, 2, False),
+    (5, 0, 3, True),
+    (4, 4, 2, True),
+]
+
+
+def time_per_call(function, repetitions):
+    return min(timeit.repeat(function, number=repetitions, repeat=5)) / repetitions
+
+
+def report(name, seconds, baseline=None):
+    line = "{:<24} {:>12.1f} us".format(name, seconds * 1e6)
+    if baseline is not None:
+        line += "   speedup {:.1f}x".format(baseline / seconds)
+    print(line)
+
+
+def benchmark_clone(args):
+    board = read_instance(args.instance).initial_state
+    print(
+        "{}x{} board with {} tiles".format(
+            board.cols, board.rows, board.number_of_tiles()
+        )
+    )
+    t_deepcopy = time_per_call(lambda: deepcopy(board), args.repetitions)
+    t_clone = time_per_call(lambda: board.clone(), args.repetitions)
+    report("deepcopy", t_deepcopy)
+    report("Board.clone", t_clone, t_deepcopy)
+
+
+# the breadth first search on single cells that compute_distances used before
+def python_distances(board, source):
+    distance = breadth_first_distance(
+        [(t.x, t.y) for t in source.get_tiles()],
+        lambda xy: direct_neighbors(*xy),
+        is_valid_neighbor=lambda xy: not board.is_blocked(*xy),
+    )
+    result = np.full((board.rows, board.cols), float("inf"), dtype=float)
+    for coord, d in distance.items():
+        result[coord] = float(d)
+    return result
+
+
+def wavefront_distances(board, source):
+    clear_distance_cache()
+    return compute_distances(board, source)
+
+
+def benchmark_distances(args):
+    for board_type in args.types:
+        for size in args.sizes:
+            random.seed(size)
+            np.random.seed(size)
+            board = BOARD_TYPES[board_type]((size, size))
+            x, y = random.choice(np.argwhere(board.concrete == 0))
+            source = Polyomino(tiles=[Tile(position=(x, y))])
+            assert np.array_equal(
+                python_distances(board, source), wavefront_distances(board, source)
+            )
+            print("{} {}x{}".format(board_type, size, size))
+            t_python = time_per_call(
+                lambda: python_distances(board, source), args.repetitions
+            )
+            t_wavefront = time_per_call(
+                lambda: wavefront_distances(board, source), args.repetitions
+            )
+            report("python breadth first", t_python)
+            report("wavefront", t_wavefront, t_python)
+
+
+# puts all items into the queue and gets them again, items are (priority, item) pairs
+def priority_queue_operations(items):
+    queue = PriorityQueue()
+    for item in items:
+        queue.put(item)
+    while not queue.empty():
+        queue.get()
+
+
+def open_list_operations(items, queue):
+    for priority, item in items:
+        queue.put(priority, item)
+    while not queue.empty():
+        queue.get()
+
+
+def benchmark_open_list(args):
+    random.seed(0)
+    for size in args.sizes:
+        # few distinct priorities with many ties, like the heuristics of the planners
+        items = [(random.randrange(size // 10 + 1), i) for i in range(size)]
+        print("{} items".format(size))
+        operations = 2 * size
+        t_queue = time_per_call(
+            lambda: priority_queue_operations(items), args.repetitions
+        )
+        t_open_list = time_per_call(
+            lambda: open_list_operations(items, OpenList()), args.repetitions
+        )
+        t_bucket_queue = time_per_call(
+            lambda: open_list_operations(items, BucketQueue()), args.repetitions
+        )
+        report("queue.PriorityQueue", t_queue / operations)
+        report("OpenList", t_open_list / operations, t_queue / operations)
+        report("BucketQueue", t_bucket_queue / operations, t_queue / operations)
+
+
+# DeltaNodeStore that also keeps the state of every node it drops, to compare it with
+# the replayed state
+class _CheckedDeltaNodeStore(DeltaNodeStore):
+    def __init__(self, checkpoint_interval):
+        super().__init__(checkpoint_interval)
+        self.nodes = []
+
+    def add(self, node):
+        node.stored_state = node.state
+        self.nodes.append(node)
+        return super().add(node)
+
+
+def benchmark_replay(args):
+    for board_type in args.types:
+        for i, (size, leftover, glues, fixed) in enumerate(REPLAY_INSTANCES):
+            random.seed(i)
+            np.random.seed(i)
+            instance = random_instance(
+                BOARD_TYPES[board_type],
+                (args.size, args.size),
+                size,
+                leftover,
+                glues,
+                fixed,
+            )
+            store = _CheckedDeltaNodeStore(args.checkpoint_interval)
+            mp = get_motion_planner(instance, node_store=store)
+            mp.solve(max_nodes=args.nodes)
+            replayed = [
+                node for node in store.nodes if node.depth % store.checkpoint_interval
+            ]
+            wrong = 0
+            seconds = 0.0
+            for node in replayed:
+                node.state = None
+                t0 = timeit.default_timer()
+                mp._load_node(node)
+                seconds += timeit.default_timer() - t0
+                wrong += node.state.data != node.stored_state.data
+            print(
+                "{} with {}".format(
+                    board_type, ", ".join(type(p).__name__ for p in mp._pruners)
+                )
+            )
+            report("replay", seconds / max(len(replayed), 1))
+            assert not wrong, "{} of {} replayed states differ".format(
+                wrong, len(replayed)
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the core operations")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    clone_parser = subparsers.add_parser(
+        "clone", help="copying a board with deepcopy and Board.clone"
+    )
+    clone_parser.add_argument(
+        "instance",
+        metavar="IN",
+        type=str,
+        nargs="?",
+        default="exampleboards/example.json",
+        help="file path to an instance",
+    )
+    clone_parser.add_argument(
+        "--repetitions",
+        "-n",
+        metavar="N",
+        type=int,
+        default=200,
+        help="number of copies per measurement",
+    )
+    clone_parser.set_defaults(run=benchmark_clone)
+
+    distances_parser = subparsers.add_parser(
+        "distances", help="distance fields of compute_distances on random boards"
+    )
+    distances_parser.add_argument(
+        "--types",
+        nargs="+",
+        choices=sorted(BOARD_TYPES),
+        default=["maze", "cave"],
+        help="board types",
+    )
+    distances_parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=[40, 80, 120],
+        help="board sizes",
+    )
+    distances_parser.add_argument(
+        "--repetitions",
+        "-n",
+        metavar="N",
+        type=int,
+        default=10,
+        help="number of distance fields per measurement",
+    )
+    distances_parser.set_defaults(run=benchmark_distances)
+
+    open_list_parser = subparsers.add_parser(
+        "openlist", help="put and get on queue.PriorityQueue and the open lists"
+    )
+    open_list_parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=int,
+        default=[1000, 100000],
+        help="numbers of queued items",
+    )
+    open_list_parser.add_argument(
+        "--repetitions",
+        "-n",
+        metavar="N",
+        type=int,
+        default=3,
+        help="number of runs per measurement",
+    )
+    open_list_parser.set_defaults(run=benchmark_open_list)
+
+    replay_parser = subparsers.add_parser(
+        "replay",
+        help="rebuilding states in a DeltaNodeStore, checked against the full states",
+    )
+    replay_parser.add_argument(
+        "--types",
+        nargs="+",
+        choices=sorted(BOARD_TYPES),
+        default=["maze", "cave"],
+        help="board types",
+    )
+    replay_parser.add_argument(
+        "--size", type=int, default=30, help="board size of the random instances"
+    )
+    replay_parser.add_argument(
+        "--nodes",
+        type=int,
+        default=3000,
+        help="number of nodes that the planner generates",
+    )
+    replay_parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        default=CHECKPOINT_INTERVAL,
+        help="levels of the search tree between nodes with their full state",
+    )
+    replay_parser.set_defaults(run=benchmark_replay)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
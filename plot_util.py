@@ -1,6 +1,5 @@
 import os
 from collections import defaultdict
-from copy import deepcopy
 
 import numpy as np
 import json
@@ -119,7 +118,7 @@ def steps_to_goal(solution_data: SolutionData):
         return None
     if solution_data.timed_out or solution_data.control_sequence is None:
         return None
-    board = deepcopy(board)
+    board = board.clone()
     tile = next(iter(board.get_tiles()))
     i = 0
     while tile.parent.size != target_shape.size:
@@ -129,6 +128,62 @@ def steps_to_goal(solution_data: SolutionData):
     return len(solution_data.control_sequence) - i
 
 
+# returns a value of the search statistics, or None for results without statistics
+def search_stat(solution_data: SolutionData, name):
+    stats = getattr(solution_data, "stats", None)
+    if stats is None:
+        return None
+    return stats[name]
+
+
+def expanded_nodes(solution_data: SolutionData):
+    return search_stat(solution_data, "nodes_expanded")
+
+
+def generated_nodes(solution_data: SolutionData):
+    return search_stat(solution_data, "nodes_generated")
+
+
+def pruned_nodes(solution_data: SolutionData):
+    pruned = search_stat(solution_data, "nodes_pruned")
+    return None if pruned is None else sum(pruned.values())
+
+
+def duplicate_nodes(solution_data: SolutionData):
+    return search_stat(solution_data, "duplicates")
+
+
+def hash_collisions(solution_data: SolutionData):
+    return search_stat(solution_data, "hash_collisions")
+
+
+def heuristic_time(solution_data: SolutionData):
+    return search_stat(solution_data, "heuristic_time")
+
+
+def expand_time(solution_data: SolutionData):
+    return search_stat(solution_data, "expand_time")
+
+
+def successor_time(solution_data: SolutionData):
+    return search_stat(solution_data, "successor_time")
+
+
+def glue_time(solution_data: SolutionData):
+    return search_stat(solution_data, "glue_time")
+
+
+def pruning_time(solution_data: SolutionData):
+    return search_stat(solution_data, "pruning_time")
+
+
+def max_open_list_size(solution_data: SolutionData):
+    sizes = search_stat(solution_data, "open_list_sizes")
+    if sizes is None:
+        return None
+    return max((size for _, _, size in sizes), default=0)
+
+
 def get_complementary(color):
     r, g, b = color
     r_comp = max(r, b, g) + min(r, b, g) - r
@@ -146,6 +201,17 @@ AXIS_FUNCTIONS = {
     "glues": glue_types,
     "target_size": target_shape_size,
     "mem": memory_usage,
+    "expanded": expanded_nodes,
+    "generated": generated_nodes,
+    "pruned": pruned_nodes,
+    "duplicates": duplicate_nodes,
+    "hash_collisions": hash_collisions,
+    "heuristic_time": heuristic_time,
+    "expand_time": expand_time,
+    "successor_time": successor_time,
+    "glue_time": glue_time,
+    "pruning_time": pruning_time,
+    "open_list": max_open_list_size,
 }
 
 AXIS_LABELS = {
@@ -157,4 +223,15 @@ AXIS_LABELS = {
     "glues": "glue types",
     "target_size": "target shape size",
     "mem": "peak memory usage [GB]",
+    "expanded": "expanded nodes",
+    "generated": "generated nodes",
+    "pruned": "pruned nodes",
+    "duplicates": "duplicate nodes",
+    "hash_collisions": "hash collisions",
+    "heuristic_time": "heuristic time [s]",
+    "expand_time": "Board.expand time [s]",
+    "successor_time": "successor handling time [s]",
+    "glue_time": "glue activation time [s]",
+    "pruning_time": "pruning time [s]",
+    "open_list": "maximum open list size",
 }
@@ -1,13 +1,22 @@
 import argparse
 import cProfile
 
+import multiprocessing
+import multiprocessing.connection
+import queue
+import signal
 import threading
+from collections import deque
+from functools import partial
 from pprint import pprint
 from pstats import SortKey, Stats
 import io
 
+import tiltmp.core.distances as distance_matrices
+import tiltmp.mp.stats as search_stats
 from tiltmp.core.serialization import read_instance, InstanceEncoder
 from tiltmp.mp.motionplanner import *
+from tiltmp.mp.nodestore import DeltaNodeStore, SpillingNodeStore
 from tiltmp.mp.rrtmotionplanner import RRTSolver
 from tiltmp.mp.solution_data import SolutionData
 
@@ -40,12 +49,15 @@ class StoppableMotionPlannerThread(threading.Thread):
         self.motion_planner.stop()
 
 
-def get_solver(name, heuristic, instance):
+# node_store creates the node store of the default solver, e.g. a SpillingNodeStore
+# that stores nodes on disk. None keeps all nodes in memory
+def get_solver(name, heuristic, instance, node_store=None):
     if name == "bfs":
         return BFSMotionPlanner(instance)
     if name == "default":
         h = HEURISTICS[heuristic]
-        return get_motion_planner(instance, heuristic=h)
+        node_store = None if node_store is None else node_store()
+        return get_motion_planner(instance, heuristic=h, node_store=node_store)
     elif name == "tileatatime":
         h = SINGLE_TILE_HEURISTICS[heuristic]
         return OneTileAtATimeMotionPlanner(instance, single_tile_heuristic=h)
@@ -55,6 +67,20 @@ def get_solver(name, heuristic, instance):
         raise ValueError("Illegal solver configuration")
 
 
+# Options that main sets on modules. Processes that are spawned instead of forked import
+# the modules anew, so the options are passed to them and set with set_options.
+def get_options():
+    return {
+        "verify_hashes": search_stats.VERIFY_HASHES,
+        "distance_dir": distance_matrices.DISTANCE_MATRIX_DIR,
+    }
+
+
+def set_options(options):
+    search_stats.VERIFY_HASHES = options["verify_hashes"]
+    distance_matrices.DISTANCE_MATRIX_DIR = options["distance_dir"]
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Solve instance of polyomino construction problem"
@@ -106,8 +132,97 @@ def main():
         default="Weighted Sum of Distances",
         help="Heuristic to be used",
     )
+    parser.add_argument(
+        "--node-memory",
+        type=int,
+        metavar="MB",
+        default=None,
+        help="memory for the nodes of the default solver, further nodes are "
+        "stored on disk (default: keep all nodes in memory)",
+    )
+    parser.add_argument(
+        "--distance-dir",
+        type=str,
+        metavar="DIR",
+        default=None,
+        help="store the all-pairs distance matrices of the boards in DIR and reuse "
+        "them in later runs. Each matrix can take up to 1 GB "
+        "(default: $TILTMP_DISTANCE_DIR, or do not store them)",
+    )
+    parser.add_argument(
+        "--verify-hashes",
+        action="store_true",
+        help="count hash collisions in the search statistics, which keeps the tiles "
+        "of every generated board (default: set if $TILTMP_VERIFY_HASHES is set)",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=int,
+        metavar="K",
+        default=None,
+        help="keep the full state only for every K-th level of the search tree of "
+        "the default solver, and rebuild the other states from their moves "
+        "(default: keep all states)",
+    )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        metavar="N",
+        type=int,
+        default=None,
+        help="solve the instances of a directory in N processes at once, and kill "
+        "instances that run past the timeout. Instances with a result file are "
+        "skipped (default: one instance after another)",
+    )
+    parser.add_argument(
+        "--portfolio",
+        type=portfolio_configuration,
+        nargs="*",
+        metavar="CONFIG",
+        default=None,
+        help="run several configurations 'solver:heuristic' at once in separate "
+        "processes and take the first solution (default configurations: {})".format(
+            ", ".join(portfolio_name(*c) for c in PORTFOLIO)
+        ),
+    )
+
+    parser.add_argument(
+        "--isolate",
+        action="store_true",
+        help="solve in a separate process that is killed at the timeout, and report "
+        "the last progress of the solver if it is killed",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        type=int,
+        metavar="MB",
+        default=None,
+        help="limit the memory of the solver process (implies --isolate)",
+    )
 
     args = parser.parse_args()
+    if args.distance_dir is not None:
+        distance_matrices.DISTANCE_MATRIX_DIR = args.distance_dir
+    if args.verify_hashes:
+        search_stats.VERIFY_HASHES = True
+    if args.portfolio is not None and args.profile:
+        parser.error("--portfolio and --profile can not be combined")
+    isolate = args.isolate or args.memory_limit is not None
+    if isolate and (args.portfolio is not None or args.profile):
+        parser.error("--isolate can not be combined with --portfolio and --profile")
+    memory_limit = None if args.memory_limit is None else args.memory_limit << 20
+    portfolio = args.portfolio
+    if portfolio == []:
+        portfolio = PORTFOLIO
+    node_store = None
+    if args.node_memory is not None and args.checkpoint_interval is not None:
+        parser.error("--node-memory and --checkpoint-interval can not be combined")
+    if args.node_memory is not None:
+        node_store = partial(SpillingNodeStore, memory_budget=args.node_memory << 20)
+    if args.checkpoint_interval is not None:
+        node_store = partial(
+            DeltaNodeStore, checkpoint_interval=args.checkpoint_interval
+        )
 
     if args.out is None and args.outdir is None:
         args.out = os.path.join(
@@ -129,7 +244,16 @@ def main():
         filenames = next(os.walk(args.input), (None, None, []))[2]
         filenames = [os.path.join(args.input, f) for f in filenames]
         run_multiple_experiments(
-            filenames, args.outdir, args.solver, args.heuristic, timeout=args.timeout
+            filenames,
+            args.outdir,
+            args.solver,
+            args.heuristic,
+            timeout=args.timeout,
+            node_store=node_store,
+            portfolio=portfolio,
+            jobs=args.jobs,
+            isolate=isolate,
+            memory_limit=memory_limit,
         )
         return
 
@@ -150,44 +274,291 @@ def main():
             args.heuristic,
             timeout=args.timeout,
             p=args.profile,
+            node_store=node_store,
+            portfolio=portfolio,
+            isolate=isolate,
+            memory_limit=memory_limit,
         )
     except FileNotFoundError:
         print("Input file not found")
         exit(-1)
 
 
-def run_experiment(input_file, output_file, solver, heuristic, timeout=None, p=False):
+def run_experiment(
+    input_file,
+    output_file,
+    solver,
+    heuristic,
+    timeout=None,
+    p=False,
+    node_store=None,
+    portfolio=None,
+    isolate=False,
+    memory_limit=None,
+):
     if os.path.isfile(output_file):
         exit(2)
     instance = read_instance(input_file)
-    results = (
-        profile(instance, solver, heuristic, timeout=timeout)
-        if p
-        else measure_time(instance, solver, heuristic, timeout=timeout)
+    if portfolio:
+        results = run_portfolio(
+            instance, portfolio, timeout=timeout, node_store=node_store
+        )
+    elif isolate:
+        results = run_isolated(
+            instance,
+            solver,
+            heuristic,
+            timeout=timeout,
+            memory_limit=memory_limit,
+            node_store=node_store,
+        )
+    elif p:
+        results = profile(
+            instance, solver, heuristic, timeout=timeout, node_store=node_store
+        )
+    else:
+        results = measure_time(
+            instance, solver, heuristic, timeout=timeout, node_store=node_store
+        )
+    pprint(
+        {
+            k: v
+            for k, v in results.__dict__.items()
+            if k not in ("runtime_profile", "stats")
+        }
     )
-    pprint({k: v for k, v in results.__dict__.items() if k != "runtime_profile"})
     if MEMORY_PROFILING:
-        max_mem_usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # the solvers of portfolios and isolated runs run in child processes
+        children = portfolio or isolate
+        who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+        max_mem_usage = resource.getrusage(who).ru_maxrss
         results.max_mem_usage = max_mem_usage
     write_results_file(results, output_file)
     if results.timed_out:
         exit(1)
 
 
+# Solves the instances one after another, or with jobs processes at once in a batch
 def run_multiple_experiments(
-    input_files, output_folder, solver, heuristic, timeout=None
+    input_files,
+    output_folder,
+    solver,
+    heuristic,
+    timeout=None,
+    node_store=None,
+    portfolio=None,
+    jobs=None,
+    isolate=False,
+    memory_limit=None,
 ):
+    if jobs:
+        run_batch(
+            input_files,
+            output_folder,
+            solver,
+            heuristic,
+            jobs,
+            timeout=timeout,
+            node_store=node_store,
+            portfolio=portfolio,
+            isolate=isolate,
+            memory_limit=memory_limit,
+        )
+        return
     for file in input_files:
         print(file)
-        output_file = os.path.join(
-            output_folder, os.path.splitext(os.path.basename(file))[0] + "_result.json"
-        )
+        output_file = result_file_path(output_folder, file)
         try:
-            run_experiment(file, output_file, solver, heuristic, timeout=timeout)
+            run_experiment(
+                file,
+                output_file,
+                solver,
+                heuristic,
+                timeout=timeout,
+                node_store=node_store,
+                portfolio=portfolio,
+                isolate=isolate,
+                memory_limit=memory_limit,
+            )
         except:
             break
 
 
+def result_file_path(output_folder, input_file):
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(output_folder, name + "_result.json")
+
+
+# seconds that a task of a batch may run past the timeout before it is killed
+BATCH_KILL_GRACE_PERIOD = 10
+
+# seconds between the checks whether a task of a batch has to be killed
+BATCH_POLL_INTERVAL = 1
+
+# name of the file in the output directory that summarizes a batch
+BATCH_SUMMARY_FILE = "summary.json"
+
+
+# Solves the instances with jobs worker processes, one process per instance. The
+# timeout is enforced by killing the process of an instance, together with the
+# processes of a portfolio, if it is still running BATCH_KILL_GRACE_PERIOD seconds
+# after the timeout. A timed out result is written for killed instances. Instances
+# whose result file exists are skipped, so that an interrupted batch can be resumed.
+# Crashes only affect their own instance. The status of all instances is written to
+# BATCH_SUMMARY_FILE in the output directory at the end. Ctrl-C and SIGTERM kill the
+# running instances, whose results are not written.
+def run_batch(
+    input_files,
+    output_folder,
+    solver,
+    heuristic,
+    jobs,
+    timeout=None,
+    node_store=None,
+    portfolio=None,
+    isolate=False,
+    memory_limit=None,
+):
+    t0 = time.time()
+    summary = {}
+    pending = deque()
+    for file in input_files:
+        output_file = result_file_path(output_folder, file)
+        if os.path.isfile(output_file):
+            summary[file] = dict(_batch_status(output_file), skipped=True)
+        else:
+            pending.append((file, output_file))
+
+    # maps the sentinels of the running processes to their tasks
+    running = {}
+    # the instances run in their own process groups, which neither signal reaches
+    previous_handler = signal.signal(signal.SIGTERM, _interrupt_batch)
+    try:
+        while pending or running:
+            while pending and len(running) < jobs:
+                file, output_file = pending.popleft()
+                process = multiprocessing.Process(
+                    target=_run_batch_task,
+                    args=(file, output_file, solver, heuristic, timeout, get_options()),
+                    kwargs={
+                        "node_store": node_store,
+                        "portfolio": portfolio,
+                        "isolate": isolate,
+                        "memory_limit": memory_limit,
+                    },
+                )
+                process.start()
+                running[process.sentinel] = process, file, output_file, time.time()
+            multiprocessing.connection.wait(list(running), timeout=BATCH_POLL_INTERVAL)
+            for sentinel, (process, file, output_file, start) in list(running.items()):
+                if process.is_alive():
+                    if timeout is None:
+                        continue
+                    if time.time() - start < timeout + BATCH_KILL_GRACE_PERIOD:
+                        continue
+                    _kill_batch_task(process)
+                    process.join()
+                    if not _is_result_file(output_file):
+                        _write_killed_result(file, output_file, time.time() - start)
+                else:
+                    process.join()
+                del running[sentinel]
+                summary[file] = _batch_status(output_file, process.exitcode)
+                print("{}: {}".format(file, summary[file]["status"]))
+    except KeyboardInterrupt:
+        print("batch interrupted, killing {} instances".format(len(running)))
+        raise
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+        for process, _, _, _ in running.values():
+            _kill_batch_task(process)
+            process.join()
+
+    counts = {}
+    for result in summary.values():
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    print(", ".join("{} {}".format(n, status) for status, n in sorted(counts.items())))
+    data = {
+        "solver": solver,
+        "heuristic": heuristic,
+        "portfolio": portfolio and [portfolio_name(*c) for c in portfolio],
+        "timeout": timeout,
+        "jobs": jobs,
+        "time_needed": time.time() - t0,
+        "counts": counts,
+        "instances": summary,
+    }
+    with open(os.path.join(output_folder, BATCH_SUMMARY_FILE), "w") as f:
+        json.dump(data, f, indent=4)
+
+
+def _interrupt_batch(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _run_batch_task(
+    input_file, output_file, solver, heuristic, timeout, options, **kwargs
+):
+    set_options(options)
+    if hasattr(os, "setpgrp"):
+        # own process group, which is killed together with the processes of portfolios
+        os.setpgrp()
+    run_experiment(input_file, output_file, solver, heuristic, timeout, **kwargs)
+
+
+def _kill_batch_task(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        # no process groups, or the process did not create its group yet
+        process.kill()
+
+
+def _is_result_file(output_file):
+    try:
+        with open(output_file) as f:
+            json.load(f)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def _write_killed_result(input_file, output_file, time_needed):
+    try:
+        instance = read_instance(input_file)
+        error = None
+    except Exception as e:
+        # the result is written without the instance, so that the batch goes on
+        instance = None
+        error = "instance could not be read: {!r}".format(e)
+    results = SolutionData(None, time_needed, instance=instance)
+    results.timed_out = True
+    results.killed = True
+    if error is not None:
+        results.error = error
+    write_results_file(results, output_file)
+
+
+# returns the status of an instance of a batch from its result file
+def _batch_status(output_file, exitcode=None):
+    try:
+        with open(output_file) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {"status": "crashed", "exitcode": exitcode}
+    if data.get("control_sequence") is not None:
+        status = "solved"
+    elif data.get("timed_out"):
+        status = "timed out"
+    else:
+        status = "unsolved"
+    result = {"status": status, "time_needed": data.get("time_needed")}
+    for key in ["control_sequence_length", "number_of_nodes", "killed", "error"]:
+        if key in data:
+            result[key] = data[key]
+    return result
+
+
 # finds unique path for output file
 def find_output_file(path: str):
     if not os.path.exists(path):
@@ -224,9 +595,9 @@ class SolverTimeoutException(Exception):
         self.solver = solver
 
 
-def _solve(instance: Instance, solver_name, heuristics, timeout=None):
+def _solve(instance: Instance, solver_name, heuristics, timeout=None, node_store=None):
     try:
-        solver = get_solver(solver_name, heuristics, instance)
+        solver = get_solver(solver_name, heuristics, instance, node_store=node_store)
     except TimeoutError:
         # return dummy motion planner without expanded nodes
         raise SolverTimeoutException(BFSMotionPlanner(instance))
@@ -242,11 +613,13 @@ def _solve(instance: Instance, solver_name, heuristics, timeout=None):
     return solver
 
 
-def measure_time(instance: Instance, solver_name, heuristics, timeout=None):
+def measure_time(
+    instance: Instance, solver_name, heuristics, timeout=None, node_store=None
+):
     timed_out = False
     t0 = time.time()
     try:
-        solver = _solve(instance, solver_name, heuristics, timeout)
+        solver = _solve(instance, solver_name, heuristics, timeout, node_store)
     except SolverTimeoutException as e:
         timed_out = True
         solver = e.solver
@@ -262,18 +635,26 @@ def measure_time(instance: Instance, solver_name, heuristics, timeout=None):
         nn = solver.number_of_nodes
     except AttributeError:
         nn = 0
-    data = SolutionData(solution, time_needed, instance=instance, number_of_nodes=nn)
+    data = SolutionData(
+        solution,
+        time_needed,
+        instance=instance,
+        number_of_nodes=nn,
+        stats=solver.stats.to_dict(),
+    )
     data.timed_out = timed_out
     return data
 
 
-def profile(instance: Instance, solver_name, heuristics, timeout=None):
+def profile(instance: Instance, solver_name, heuristics, timeout=None, node_store=None):
     timed_out = False
     t0 = time.time()
     pr = cProfile.Profile()
     pr.enable()
     try:
-        solver = _solve(instance, solver_name, heuristics, timeout=timeout)
+        solver = _solve(
+            instance, solver_name, heuristics, timeout=timeout, node_store=node_store
+        )
     except SolverTimeoutException as e:
         timed_out = True
         solver = e.solver
@@ -298,10 +679,294 @@ def profile(instance: Instance, solver_name, heuristics, timeout=None):
         runtime_profile=stats,
         instance=instance,
         number_of_nodes=nn,
+        stats=solver.stats.to_dict(),
     )
     data.timed_out = timed_out
     return data
 
 
+# configurations of the portfolio mode as (solver, heuristic) pairs
+PORTFOLIO = [
+    ("default", "Weighted Sum of Distances"),
+    ("default", "Greatest Distance"),
+    ("tileatatime", "Distance to fixed Destination"),
+    ("rrt", None),
+]
+
+# seconds between the checks whether a portfolio run is finished
+PORTFOLIO_POLL_INTERVAL = 0.1
+
+# seconds that the remaining solvers get to stop after a solution was found, before
+# their processes are terminated
+PORTFOLIO_GRACE_PERIOD = 5
+
+
+# parses a portfolio configuration "solver:heuristic", or "solver" for solvers without
+# heuristic
+def portfolio_configuration(text):
+    solver, _, heuristic = text.partition(":")
+    heuristics = {"default": HEURISTICS, "tileatatime": SINGLE_TILE_HEURISTICS}
+    if solver in heuristics:
+        if heuristic not in heuristics[solver]:
+            raise argparse.ArgumentTypeError(
+                "unknown heuristic for {}: '{}'".format(solver, heuristic)
+            )
+        return solver, heuristic
+    if solver in ("bfs", "rrt") and not heuristic:
+        return solver, None
+    raise argparse.ArgumentTypeError("illegal solver configuration: " + text)
+
+
+def portfolio_name(solver, heuristic):
+    return solver if heuristic is None else "{}:{}".format(solver, heuristic)
+
+
+# Solves the instance with one configuration of a portfolio in a worker process, and
+# puts the index of the configuration, the solution, number of nodes, time needed and
+# search statistics into results. The solver is stopped when stop is set, which reports nothing.
+def _solve_portfolio_member(
+    index, instance, solver_name, heuristic, node_store, stop, results, options
+):
+    set_options(options)
+    t0 = time.time()
+    try:
+        solver = get_solver(solver_name, heuristic, instance, node_store=node_store)
+        thread = StoppableMotionPlannerThread(solver)
+        thread.daemon = True
+        thread.start()
+        while thread.is_alive() and not stop.is_set():
+            thread.join(PORTFOLIO_POLL_INTERVAL)
+        if thread.is_alive():
+            thread.stop()
+            thread.join()
+            return
+        solution = solver.extract_solution()
+        nn = getattr(solver, "number_of_nodes", 0)
+        stats = solver.stats.to_dict()
+    except Exception as e:
+        print("{} failed: {!r}".format(portfolio_name(solver_name, heuristic), e))
+        solution, nn, stats = None, 0, None
+    if solution is not None:
+        solution = "".join(solution)
+    results.put((index, solution, nn, time.time() - t0, stats))
+
+
+# Runs all configurations on the instance at once, each in its own process, and takes
+# the first solution. The other solvers are stopped by MotionPlanner.stop, and
+# terminated if they do not stop within PORTFOLIO_GRACE_PERIOD, e.g. while computing
+# distances. The processes are daemonic, so that they do not outlive this one, and
+# compute distances without worker processes, since the solvers already use the cores.
+# The SolutionData records the configuration that won, and its number of nodes and time
+# needed.
+def run_portfolio(instance: Instance, configurations, timeout=None, node_store=None):
+    t0 = time.time()
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    options = get_options()
+    processes = [
+        multiprocessing.Process(
+            target=_solve_portfolio_member,
+            args=(i, instance, solver, heuristic, node_store, stop, results, options),
+            daemon=True,
+        )
+        for i, (solver, heuristic) in enumerate(configurations)
+    ]
+    for process in processes:
+        process.start()
+
+    winner = None
+    timed_out = False
+    reported = 0
+    while winner is None and reported < len(processes):
+        try:
+            result = results.get(timeout=PORTFOLIO_POLL_INTERVAL)
+        except queue.Empty:
+            if timeout is not None and time.time() - t0 > timeout:
+                timed_out = True
+                break
+            if not any(process.is_alive() for process in processes):
+                # crashed processes never report
+                if results.empty():
+                    break
+            continue
+        reported += 1
+        if result[1] is not None:
+            winner = result
+    time_needed = time.time() - t0
+
+    stop.set()
+    for process in processes:
+        process.join(PORTFOLIO_GRACE_PERIOD)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+    if winner is None:
+        data = SolutionData(None, time_needed, instance=instance)
+        data.portfolio_winner = None
+    else:
+        index, solution, nn, winner_time, stats = winner
+        data = SolutionData(
+            solution, time_needed, instance=instance, number_of_nodes=nn, stats=stats
+        )
+        data.portfolio_winner = portfolio_name(*configurations[index])
+        data.winner_time_needed = winner_time
+    data.portfolio = [portfolio_name(*c) for c in configurations]
+    data.timed_out = timed_out
+    return data
+
+
+# seconds between the progress reports of a solver in an isolated process
+PROGRESS_INTERVAL = 1
+
+
+# Solves the instance in a child process, which is killed at the timeout instead of
+# being asked to stop, so that e.g. the precomputation of distances can not run past it.
+# The child is daemonic and computes distances without worker processes, which would
+# outlive it when it is killed. The memory of the child is limited to memory_limit bytes
+# and its CPU time to the timeout by setrlimit. The child reports the number of nodes,
+# the best heuristic value, the control sequence to the best node and the search
+# statistics every PROGRESS_INTERVAL seconds. The SolutionData of a run that was killed
+# or failed contains the last report.
+def run_isolated(
+    instance: Instance,
+    solver_name,
+    heuristics,
+    timeout=None,
+    memory_limit=None,
+    node_store=None,
+):
+    t0 = time.time()
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(
+        target=_solve_isolated,
+        args=(instance, solver_name, heuristics, timeout, memory_limit, node_store),
+        kwargs={"connection": sender, "options": get_options()},
+        daemon=True,
+    )
+    process.start()
+    sender.close()
+
+    progress = []
+    result = None
+    timed_out = False
+    while result is None:
+        remaining = None
+        if timeout is not None:
+            remaining = max(0.0, t0 + timeout - time.time())
+        if not receiver.poll(remaining):
+            timed_out = True
+            break
+        try:
+            kind, value = receiver.recv()
+        except EOFError:
+            # the process ended without a result, e.g. it was killed by a limit
+            break
+        if kind == "progress":
+            progress.append(value)
+        else:
+            result = kind, value
+    time_needed = time.time() - t0
+    if process.is_alive():
+        process.kill()
+    process.join()
+    receiver.close()
+
+    if result is not None and result[0] == "solved":
+        solution, nn = result[1]
+        data = SolutionData(
+            solution, time_needed, instance=instance, number_of_nodes=nn
+        )
+    else:
+        nn = progress[-1][1] if progress else 0
+        data = SolutionData(None, time_needed, instance=instance, number_of_nodes=nn)
+        data.timed_out = timed_out
+        if result is not None:
+            data.error = result[1]
+        elif not timed_out:
+            data.error = "solver process ended with exit code {}".format(
+                process.exitcode
+            )
+    if progress:
+        # time, number of nodes and best heuristic value of every report
+        data.progress = [report[:3] for report in progress]
+        data.best_heuristic_value = progress[-1][2]
+        data.best_control_sequence = progress[-1][3]
+        data.stats = progress[-1][4]
+    return data
+
+
+def _solve_isolated(
+    instance,
+    solver_name,
+    heuristics,
+    timeout,
+    memory_limit,
+    node_store,
+    connection,
+    options,
+):
+    set_options(options)
+    t0 = time.time()
+    solver = None
+    done = threading.Event()
+
+    def report_progress():
+        while not done.wait(PROGRESS_INTERVAL):
+            if solver is not None:
+                connection.send(("progress", _progress(solver, time.time() - t0)))
+
+    reporter = threading.Thread(target=report_progress, daemon=True)
+    reporter.start()
+    # limited after the reporter is started, whose stack counts against the limit
+    if MEMORY_PROFILING:
+        if memory_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        if timeout is not None:
+            cpu_time = int(timeout) + 1
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_time, cpu_time))
+    try:
+        solver = get_solver(solver_name, heuristics, instance, node_store=node_store)
+        solver.solve()
+        solution = solver.extract_solution()
+        result = "solved", (
+            None if solution is None else "".join(solution),
+            getattr(solver, "number_of_nodes", 0),
+        )
+    except MemoryError:
+        result = "failed", "out of memory"
+    except Exception as e:
+        result = "failed", repr(e)
+    done.set()
+    reporter.join()
+    if solver is not None:
+        connection.send(("progress", _progress(solver, time.time() - t0)))
+    connection.send(result)
+    connection.close()
+
+
+# returns the time, number of nodes, best heuristic value, control sequence to the best
+# node and statistics of a solver, which is still running in another thread
+def _progress(solver, seconds):
+    best_node = getattr(solver, "best_node", None)
+    best_heuristic_value = getattr(solver, "best_heuristic_value", None)
+    control_sequence = None
+    if best_node is not None:
+        try:
+            control_sequence = "".join(BFSMotionPlanner.get_control_sequence(best_node))
+        except Exception:
+            # e.g. stored nodes that are read while the node store grows
+            pass
+    if best_heuristic_value is not None:
+        best_heuristic_value = float(best_heuristic_value)
+    return [
+        seconds,
+        getattr(solver, "number_of_nodes", 0),
+        best_heuristic_value,
+        control_sequence,
+        solver.stats.to_dict(),
+    ]
+
+
 if __name__ == "__main__":
     main()
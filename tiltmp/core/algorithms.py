@@ -1,12 +1,34 @@
+import hashlib
 import json
 import os
 import time
+from collections import Counter, OrderedDict
 from copy import copy
 from typing import Iterable, Set, Dict
-from queue import PriorityQueue
 
+from tiltmp.core.openlist import OpenList
 from tiltmp.core.tumbletiles import *
 
+# maximum number of distance fields that are kept by compute_distances
+DISTANCE_CACHE_SIZE = 128
+
+# maps (board fingerprint, source cells) to the distance field, least recently used first
+_distance_cache = OrderedDict()
+
+# maximum number of placement sets that are kept by fitting_positions
+PLACEMENT_CACHE_SIZE = 256
+
+# maps (board fingerprint, shape) to the positions where the shape fits, least recently
+# used first
+_placement_cache = OrderedDict()
+
+# maximum number of packing problems whose answers are kept by is_packable
+PACKING_CACHE_SIZE = 4096
+
+# maps (container, sorted shapes) to whether the shapes can be packed, least recently
+# used first
+_packing_cache = OrderedDict()
+
 
 def breadth_first_reachable(start, neighbors, is_valid_neighbor=lambda n: True):
     return breadth_first_distance(
@@ -44,47 +66,178 @@ def breadth_first_path_exists(
 
 def reachable_set(board, poly):
     position, rel_coord = poly.get_shape()
+    fitting = fitting_positions(board, rel_coord)
     reachable = {position}
     active = deque([position])
     while active:
         current = active.popleft()
         for xy in direct_neighbors(*current):
-            if xy not in reachable and board.fits(xy, rel_coord):
+            if xy not in reachable and xy in fitting:
                 reachable.add(xy)
                 active.append(xy)
     return reachable
 
 
+# returns a digest of the size and the concrete of the board
+def board_fingerprint(board):
+    digest = hashlib.blake2b(repr((board.rows, board.cols)).encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(board.concrete, dtype=bool).tobytes())
+    return digest.hexdigest()
+
+
+# Distance fields only depend on the concrete and the source cells, so they are cached
+# across heuristics and planners. The returned arrays are shared and read-only.
 def compute_distances(board, target_shape):
-    distance = {(t.x, t.y): 0 for t in target_shape.get_tiles()}
-    active = deque(distance.keys())
-    while active:
-        current = active.popleft()
-        for xy in direct_neighbors(*current):
-            if not board.is_blocked(*xy) and xy not in distance:
-                distance[xy] = distance[current] + 1
-                active.append(xy)
-    result = np.full((board.rows, board.cols), float("inf"), dtype=float)
-    for coord, dist in distance.items():
-        result[coord] = float(dist)
+    sources = frozenset((t.x, t.y) for t in target_shape.get_tiles())
+    key = board_fingerprint(board), sources
+    result = _distance_cache.get(key)
+    if result is not None:
+        _distance_cache.move_to_end(key)
+        return result
+    result = wavefront_distances(board, sources)
+    result.flags.writeable = False
+    _distance_cache[key] = result
+    if len(_distance_cache) > DISTANCE_CACHE_SIZE:
+        _distance_cache.popitem(last=False)
     return result
 
 
+def clear_distance_cache():
+    _distance_cache.clear()
+
+
+# Breadth first search that expands a whole layer of cells at once. Cells are indexed in
+# a copy of the board padded with walls, where the neighbors of a cell are at fixed
+# offsets. Only cells in the optional passable mask are entered. Unreachable cells have
+# an infinite distance.
+class WavefrontSearch:
+    def __init__(self, concrete, passable=None):
+        self.shape = concrete.shape
+        self._stride = self.shape[1] + 2
+        free = ~concrete.astype(bool)
+        if passable is not None:
+            free &= passable
+        self._free = np.zeros((self.shape[0] + 2, self._stride), dtype=bool)
+        self._free[1:-1, 1:-1] = free
+        self._free = self._free.ravel()
+        self._offsets = np.array([-self._stride, self._stride, -1, 1])
+
+    # index of the cell in the padded board
+    def index(self, x, y):
+        return (x + 1) * self._stride + y + 1
+
+    # returns the distances of all cells of the padded board to the closest source
+    def search(self, sources):
+        unvisited = self._free.copy()
+        distances = np.full(unvisited.size, float("inf"), dtype=float)
+        frontier = np.array([self.index(x, y) for x, y in sources], dtype=np.intp)
+        distances[frontier] = 0.0
+        unvisited[frontier] = False
+        distance = 0
+        while frontier.size:
+            distance += 1
+            frontier = (frontier[:, np.newaxis] + self._offsets).ravel()
+            frontier = frontier[unvisited[frontier]]
+            if frontier.size > 1:
+                frontier = np.unique(frontier)
+            unvisited[frontier] = False
+            distances[frontier] = distance
+        return distances
+
+    def distances(self, sources):
+        padded = self.search(sources).reshape(self.shape[0] + 2, self._stride)
+        return padded[1:-1, 1:-1].copy()
+
+    # Searches from each of the source cells separately and returns the matrix of the
+    # distances from the sources to the target cells, both given as arrays of (x, y).
+    # The distances have the unsigned integer type, whose largest value marks
+    # unreachable cells. The searches run side by side on copies of the padded board,
+    # so that each layer is expanded for all of them at once.
+    def distances_between(self, sources, targets, dtype=np.uint16):
+        size = self._free.size
+        unreachable = np.iinfo(dtype).max
+        sources = self.index(sources[:, 0], sources[:, 1])
+        targets = self.index(targets[:, 0], targets[:, 1])
+
+        unvisited = np.tile(self._free, len(sources))
+        distances = np.full(unvisited.size, unreachable, dtype=dtype)
+        # position of each cell in the frontier, used to remove duplicates
+        position = np.empty(unvisited.size, dtype=np.intp)
+        frontier = np.arange(len(sources)) * size + sources
+        distances[frontier] = 0
+        unvisited[frontier] = False
+        distance = 0
+        while frontier.size:
+            distance += 1
+            frontier = (frontier[:, np.newaxis] + self._offsets).ravel()
+            frontier = frontier[unvisited[frontier]]
+            positions = np.arange(frontier.size)
+            position[frontier] = positions
+            frontier = frontier[position[frontier] == positions]
+            unvisited[frontier] = False
+            distances[frontier] = distance
+        return distances.reshape(len(sources), size)[:, targets]
+
+
+def wavefront_distances(board, sources, passable=None):
+    return WavefrontSearch(board.concrete, passable).distances(sources)
+
+
 def compute_distance_within_set(board, target_shape, s):
-    distance = {(t.x, t.y): 0 for t in target_shape.get_tiles()}
-    active = deque(distance.keys())
-    while active:
-        current = active.popleft()
-        for xy in direct_neighbors(*current):
-            if not board.is_blocked(*xy) and xy not in distance and xy in s:
-                distance[xy] = distance[current] + 1
-                active.append(xy)
-    result = np.full((board.rows, board.cols), float("inf"), dtype=float)
-    for coord, dist in distance.items():
-        result[coord] = float(dist)
+    sources = [(t.x, t.y) for t in target_shape.get_tiles()]
+    inside = np.zeros(board.concrete.shape, dtype=bool)
+    if s:
+        xs, ys = zip(*s)
+        inside[xs, ys] = True
+    return wavefront_distances(board, sources, passable=inside)
+
+
+# Returns a boolean array that is True at the positions where the shape given by the
+# relative coordinates fits without colliding with concrete or walls. This is the
+# erosion of the free cells by the shape: a position is valid iff the free mask shifted
+# by every offset of the shape is free there. Cells outside the board are blocked.
+def placement_mask(board, relative_coordinates):
+    free = ~board.concrete.astype(bool)
+    rows, cols = free.shape
+    mask = np.ones_like(free)
+    for dx, dy in relative_coordinates:
+        shifted = np.zeros_like(free)
+        shifted[
+            max(0, -dx) : min(rows, rows - dx), max(0, -dy) : min(cols, cols - dy)
+        ] = free[max(0, dx) : min(rows, rows + dx), max(0, dy) : min(cols, cols + dy)]
+        mask &= shifted
+    return mask
+
+
+# Returns the set of positions where the shape fits, which makes board.fits an O(1)
+# lookup in searches. The sets only depend on the concrete and the shape, so they are
+# cached across the searches of pruners, heuristics and planners.
+def fitting_positions(board, relative_coordinates):
+    key = board_fingerprint(board), frozenset(relative_coordinates)
+    result = _placement_cache.get(key)
+    if result is not None:
+        _placement_cache.move_to_end(key)
+        return result
+    xs, ys = np.nonzero(placement_mask(board, key[1]))
+    result = frozenset(zip(xs.tolist(), ys.tolist()))
+    _placement_cache[key] = result
+    if len(_placement_cache) > PLACEMENT_CACHE_SIZE:
+        _placement_cache.popitem(last=False)
     return result
 
 
+# Returns the set of positions from which the shape can be moved to a position in the
+# area. Moves are reversible, so this is a single breadth first search over the
+# placement mask that starts at the positions of the area where the shape fits.
+def positions_reaching_area(board, relative_coordinates, area):
+    fitting = fitting_positions(board, relative_coordinates)
+    sources = [xy for xy in area if xy in fitting]
+    passable = placement_mask(board, relative_coordinates)
+    distances = wavefront_distances(board, sources, passable=passable)
+    xs, ys = np.nonzero(np.isfinite(distances))
+    return frozenset(zip(xs.tolist(), ys.tolist()))
+
+
 class PathsTree:
     def __init__(self, paths: dict):
         self._paths = paths
@@ -114,13 +267,14 @@ class PathsTree:
     @staticmethod
     def compute_shortest_paths_tree(board: Board, polyomino: Polyomino):
         position, rel_coord = polyomino.get_shape()
+        fitting = fitting_positions(board, rel_coord)
         # maps position to previous position on the shortest path
         paths = {position: None}
         active = deque([position])
         while active:
             current = active.popleft()
             for xy in direct_neighbors(*current):
-                if xy not in paths and board.fits(xy, rel_coord):
+                if xy not in paths and xy in fitting:
                     paths[xy] = current
                     active.append(xy)
         return PathsTree(paths)
@@ -131,24 +285,23 @@ def find_shortest_path(board: Board, polyomino: Polyomino, target_position: tupl
     def heuristic(p):
         return abs(target_position[0] - p[0]) + abs(target_position[1] - p[1])
 
-    queue = PriorityQueue()
+    queue = OpenList()
     position, rel_coord = polyomino.get_shape()
+    fitting = fitting_positions(board, rel_coord)
     paths = {position: None}
     g_score = {position: 0}
 
-    queue.put((heuristic(position), position))
+    queue.put(heuristic(position), position)
     while not queue.empty():
-        current = queue.get()[1]
+        current = queue.get()
         tentative_g_score = g_score[current] + 1
         for xy in direct_neighbors(*current):
-            if board.fits(xy, rel_coord) and tentative_g_score < g_score.get(
-                xy, float("inf")
-            ):
+            if xy in fitting and tentative_g_score < g_score.get(xy, float("inf")):
                 paths[xy] = current
                 g_score[xy] = tentative_g_score
                 if xy == target_position:
                     return PathsTree(paths)
-                queue.put((g_score[xy] + heuristic(xy), xy))
+                queue.put(g_score[xy] + heuristic(xy), xy, key=xy)
     return PathsTree(paths)
 
 
@@ -188,19 +341,20 @@ def is_reachable_area(board: Board, polyomino: Polyomino, target_area: set):
     def heuristic(p):
         return abs(c[0] - p[0]) + abs(c[1] - p[1])
 
-    queue = PriorityQueue()
+    queue = OpenList()
     position, rel_coord = polyomino.get_shape()
+    fitting = fitting_positions(board, rel_coord)
     paths = {position: None}
 
-    queue.put((heuristic(position), position))
+    queue.put(heuristic(position), position)
     while not queue.empty():
-        current = queue.get()[1]
+        current = queue.get()
         if current in target_area:
             return PathsTree(paths)
         for xy in direct_neighbors(*current):
-            if board.fits(xy, rel_coord) and xy not in paths:
+            if xy in fitting and xy not in paths:
                 paths[xy] = current
-                queue.put((heuristic(xy), xy))
+                queue.put(heuristic(xy), xy)
     return False
 
 
@@ -211,24 +365,23 @@ def distance_to_area(board: Board, polyomino: Polyomino, target_area: set):
     def heuristic(p):
         return abs(c[0] - p[0]) + abs(c[1] - p[1])
 
-    queue = PriorityQueue()
+    queue = OpenList()
     position, rel_coord = polyomino.get_shape()
+    fitting = fitting_positions(board, rel_coord)
     paths = {position: None}
     g_score = {position: 0}
 
-    queue.put((heuristic(position), position))
+    queue.put(heuristic(position), position)
     while not queue.empty():
-        current = queue.get()[1]
+        current = queue.get()
         tentative_g_score = g_score[current] + 1
         for xy in direct_neighbors(*current):
-            if board.fits(xy, rel_coord) and tentative_g_score < g_score.get(
-                xy, float("inf")
-            ):
+            if xy in fitting and tentative_g_score < g_score.get(xy, float("inf")):
                 paths[xy] = current
                 g_score[xy] = tentative_g_score
                 if xy in target_area:
                     return g_score[xy]
-                queue.put((g_score[xy] + heuristic(xy), xy))
+                queue.put(g_score[xy] + heuristic(xy), xy, key=xy)
     return float("inf")
 
 
@@ -247,10 +400,7 @@ def _fits_at(shape1, shape2, x, y):
 # takes shapes as sets of relative coordinates
 # returns true iff shape2 can be fit into shape1
 def fits(shape1: Set[tuple], shape2: Set[tuple]):
-    for x, y in shape1:
-        if _fits_at(shape1, shape2, x, y):
-            return True
-    return False
+    return is_packable(shape1, [shape2])
 
 
 # yields all possible positions, where shape2 fits in shape1
@@ -260,23 +410,101 @@ def get_packings(shape1: Set[tuple], shape2: Set[tuple]):
             yield x, y
 
 
-# returns True iff a packing exists
+# Returns True iff a packing exists. Shapes are compared up to translation, and the
+# answers are cached by the container and the multiset of shapes, since the pruners ask
+# about the same few combinations over and over during a search.
 def is_packable(container: Set[tuple], shapes: Iterable[Set[tuple]]):
-    ascending = tuple(sorted(shapes, key=lambda s: len(s)))
-    if sum(len(s) for s in ascending) > len(container):
+    key = _translated_to_origin(container), frozenset(
+        Counter(_translated_to_origin(s) for s in shapes if s).items()
+    )
+    result = _packing_cache.get(key)
+    if result is not None:
+        _packing_cache.move_to_end(key)
+        return result
+    container, shapes = key
+    if sum(len(s) * count for s, count in shapes) > len(container):
         # to many tiles in combined shapes
-        return False
-    return _is_packable_recursive(container, ascending)
+        result = False
+    else:
+        result = _is_packable_bitmask(container, shapes)
+    _packing_cache[key] = result
+    if len(_packing_cache) > PACKING_CACHE_SIZE:
+        _packing_cache.popitem(last=False)
+    return result
+
+
+# translates the shape such that its smallest coordinate is (0, 0), like the relative
+# coordinates of a polyomino
+def _translated_to_origin(shape):
+    if not shape:
+        return frozenset()
+    x0, y0 = min(shape)
+    if x0 == y0 == 0:
+        return frozenset(shape)
+    return frozenset((x - x0, y - y0) for x, y in shape)
+
+
+# Cells (x, y) of the bounding box of the container are the bits x * height + y of an
+# integer, so a placement of a shape is a bitmask, and placements overlap iff their
+# masks share a bit. The largest shapes are placed first. Equal shapes are placed in
+# the order of their placements, which skips permutations of them, and states of the
+# search that failed before are remembered.
+def _is_packable_bitmask(container, shapes):
+    if not shapes:
+        return True
+    container = _translated_to_first_quadrant(container)
+    width = max(x for x, _ in container) + 1
+    height = max(y for _, y in container) + 1
+    container_mask = _shape_mask(container, height)
+
+    placements = []
+    same_as_previous = []
+    for s, count in sorted(shapes, key=lambda item: len(item[0]), reverse=True):
+        s = _translated_to_first_quadrant(s)
+        w = max(x for x, _ in s) + 1
+        h = max(y for _, y in s) + 1
+        mask = _shape_mask(s, height)
+        masks = []
+        for dx in range(width - w + 1):
+            for dy in range(height - h + 1):
+                m = mask << (dx * height + dy)
+                if m & container_mask == m:
+                    masks.append(m)
+        if len(masks) < count:
+            return False
+        placements += [masks] * count
+        same_as_previous += [False] + [True] * (count - 1)
+    return _pack(placements, same_as_previous, 0, 0, 0, set())
+
+
+def _translated_to_first_quadrant(shape):
+    x0 = min(x for x, _ in shape)
+    y0 = min(y for _, y in shape)
+    return [(x - x0, y - y0) for x, y in shape]
+
 
+def _shape_mask(shape, height):
+    mask = 0
+    for x, y in shape:
+        mask |= 1 << (x * height + y)
+    return mask
 
-def _is_packable_recursive(container: Set[tuple], ascending):
-    if not ascending:
+
+def _pack(placements, same_as_previous, i, used, start, failed):
+    if i == len(placements):
         return True
-    s = ascending[-1]
-    for x, y in get_packings(container, s):
-        new_container = container - {(dx + x, dy + y) for dx, dy in s}
-        if _is_packable_recursive(new_container, ascending[:-1]):
+    state = used, i, start
+    if state in failed:
+        return False
+    masks = placements[i]
+    for j in range(start, len(masks)):
+        m = masks[j]
+        if m & used:
+            continue
+        following = j + 1 if i + 1 < len(placements) and same_as_previous[i + 1] else 0
+        if _pack(placements, same_as_previous, i + 1, used | m, following, failed):
             return True
+    failed.add(state)
     return False
 
 
@@ -305,14 +533,14 @@ def is_connected_by_glues(glues: Dict[tuple, Glues], rules: GlueRules):
         current = active.pop()
         current_glues = glues[current]
         for d in Direction:
+            glue = getattr(current_glues, d.value)
+            if not rules.sticks_to_anything(glue):
+                continue
             neighbor = current[0] + d.vector()[0], current[1] + d.vector()[1]
             if neighbor in visited or neighbor not in glues:
                 continue
             neighbor_glues = glues[neighbor]
-            if rules.sticks(
-                getattr(current_glues, d.value),
-                getattr(neighbor_glues, d.inverse().value),
-            ):
+            if rules.sticks(glue, getattr(neighbor_glues, d.inverse().value)):
                 visited.add(neighbor)
                 active.append(neighbor)
     return len(visited) == len(glues)
@@ -328,14 +556,14 @@ def glue_connected_component(start: tuple, glues: Dict[tuple, Glues], rules: Glu
         current = active.pop()
         current_glues = glues[current]
         for d in Direction:
+            glue = getattr(current_glues, d.value)
+            if not rules.sticks_to_anything(glue):
+                continue
             neighbor = current[0] + d.vector()[0], current[1] + d.vector()[1]
             if neighbor in visited or neighbor not in glues:
                 continue
             neighbor_glues = glues[neighbor]
-            if rules.sticks(
-                getattr(current_glues, d.value),
-                getattr(neighbor_glues, d.inverse().value),
-            ):
+            if rules.sticks(glue, getattr(neighbor_glues, d.inverse().value)):
                 visited.add(neighbor)
                 active.append(neighbor)
     return visited
@@ -421,7 +649,7 @@ def direct_path_between_configs(b: Board, state1, state2):
 
 
 def shorten_solution(instance, sequence):
-    board = deepcopy(instance.initial_state)
+    board = instance.initial_state.clone()
     sequence = list(sequence)
 
     current_sequence_position = 0
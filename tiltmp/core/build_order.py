@@ -207,13 +207,18 @@ def is_convex(shape: Set[tuple], tile: tuple):
 def remove_path_exists(glues: Dict[tuple, Glues], tile_position, glue_rules: GlueRules):
     blocked_positions = set()
     tile_glues = glues[tile_position]
+    # only sides of the tile with glues that stick to something can be blocked by glues
+    sticky_sides = [
+        (direction, getattr(tile_glues, direction.inverse().value))
+        for direction in Direction
+        if glue_rules.sticks_to_anything(getattr(tile_glues, direction.inverse().value))
+    ]
     for xy, g in glues.items():
         if xy == tile_position:
             continue
         blocked_positions.add(xy)
-        for direction in Direction:
+        for direction, glue2 in sticky_sides:
             glue1 = getattr(glues[xy], direction.value)
-            glue2 = getattr(tile_glues, direction.inverse().value)
             if glue_rules.sticks(glue1, glue2):
                 blocked_positions.add(neighbor(xy, direction))
     outside = (-2, 0)
@@ -235,13 +240,18 @@ def remove_path_exists_fixed(
 ):
     blocked_positions = set()
     tile_glues = glues[tile_position]
+    # only sides of the tile with glues that stick to something can be blocked by glues
+    sticky_sides = [
+        (direction, getattr(tile_glues, direction.inverse().value))
+        for direction in Direction
+        if glue_rules.sticks_to_anything(getattr(tile_glues, direction.inverse().value))
+    ]
     for xy, g in glues.items():
         if xy == tile_position:
             continue
         blocked_positions.add(xy)
-        for direction in Direction:
+        for direction, glue2 in sticky_sides:
             glue1 = getattr(glues[xy], direction.value)
-            glue2 = getattr(tile_glues, direction.inverse().value)
             if glue_rules.sticks(glue1, glue2):
                 blocked_positions.add(neighbor(xy, direction))
 
@@ -0,0 +1,354 @@
+import multiprocessing
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from tiltmp.core.algorithms import WavefrontSearch, board_fingerprint
+
+# Directory in which the all-pairs distance matrices are stored, one file of up to
+# MAX_DISTANCE_MATRIX_BYTES per board. None, the default, disables storing
+DISTANCE_MATRIX_DIR = os.environ.get("TILTMP_DISTANCE_DIR") or None
+
+# maximum number of all-pairs distance matrices that are kept open
+ALL_PAIRS_CACHE_SIZE = 4
+
+_all_pairs_cache = OrderedDict()
+
+# number of cells that are searched together when a matrix is computed
+SEARCH_BLOCK_SIZE = 1 << 18
+
+# number of worker processes that compute distance matrices. None uses all cores
+DISTANCE_WORKERS = None
+
+# size in bytes of the largest distance matrix, larger boards use landmark distances
+MAX_DISTANCE_MATRIX_BYTES = 1 << 30
+
+# number of landmarks of landmark distances
+LANDMARKS = 16
+
+# number of distance fields that landmark distances keep for exact distances
+EXACT_DISTANCE_CACHE_SIZE = 64
+
+
+def available_workers():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+# Answers shortest path distances between cells of a board
+class DistanceOracle(ABC):
+    # returns the distance from source to target, which is infinite if there is no path
+    @abstractmethod
+    def get_distance(self, source, target):
+        pass
+
+
+# Shortest path distances between the given cells of a board, on paths that only lead
+# through the cells in the optional passable mask. The cells are numbered in the given
+# order, and the distances are stored in a single matrix of unsigned integers in which
+# the largest value marks unreachable cells. The rows are computed in blocks, by a pool
+# of worker processes if more than one worker is available.
+class DistanceMatrix(DistanceOracle):
+    def __init__(
+        self,
+        board,
+        cells,
+        passable=None,
+        workers=None,
+        timeout=None,
+        progress=None,
+        compute=True,
+    ):
+        self.cells = np.asarray(cells, dtype=np.intp).reshape(-1, 2)
+        self.index = np.full(board.concrete.shape, -1, dtype=np.int32)
+        self.index[self.cells[:, 0], self.cells[:, 1]] = np.arange(len(self.cells))
+        n = len(self.cells)
+        self.dtype = np.uint16 if n < np.iinfo(np.uint16).max else np.uint32
+        self.unreachable = np.iinfo(self.dtype).max
+        self.matrix = None
+        if compute:
+            self.matrix = self._compute(board, passable, workers, timeout, progress)
+
+    def _compute(self, board, passable, workers, timeout, progress):
+        if workers is None:
+            workers = DISTANCE_WORKERS or available_workers()
+        n = len(self.cells)
+        block = max(1, SEARCH_BLOCK_SIZE // board.concrete.size)
+        blocks = [(start, min(start + block, n)) for start in range(0, n, block)]
+        deadline = None if timeout is None else time.time() + timeout
+        # daemonic processes, e.g. the solvers of a portfolio, can not start workers
+        daemon = multiprocessing.current_process().daemon
+        if workers > 1 and len(blocks) > 1 and not daemon:
+            try:
+                return self._compute_parallel(
+                    board, passable, blocks, workers, deadline, progress
+                )
+            except TimeoutError:
+                raise
+            except (OSError, BrokenProcessPool, AssertionError):
+                # e.g. no shared memory or no more processes, compute in this process
+                pass
+        return self._compute_serial(board, passable, blocks, deadline, progress)
+
+    def _compute_serial(self, board, passable, blocks, deadline, progress):
+        n = len(self.cells)
+        matrix = np.empty((n, n), dtype=self.dtype)
+        search = WavefrontSearch(board.concrete, passable)
+        for start, stop in blocks:
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError("computation of distance map timed out")
+            matrix[start:stop] = search.distances_between(
+                self.cells[start:stop], self.cells, self.dtype
+            )
+            _report_progress(progress, start, stop, n)
+        return matrix
+
+    # The workers write the rows into a matrix in shared memory, which is copied once
+    # all blocks are done.
+    def _compute_parallel(self, board, passable, blocks, workers, deadline, progress):
+        n = len(self.cells)
+        shape = (n, n)
+        memory = shared_memory.SharedMemory(
+            create=True, size=max(1, n * n * np.dtype(self.dtype).itemsize)
+        )
+        try:
+            pool = ProcessPoolExecutor(
+                max_workers=min(workers, len(blocks)),
+                initializer=_initialize_worker,
+                initargs=(
+                    board.concrete,
+                    passable,
+                    self.cells,
+                    memory.name,
+                    shape,
+                    self.dtype,
+                ),
+            )
+            pending = set()
+            try:
+                pending = {pool.submit(_compute_rows, *block) for block in blocks}
+                done = 0
+                while pending:
+                    remaining = None
+                    if deadline is not None:
+                        remaining = max(0.0, deadline - time.time())
+                    finished, pending = wait(
+                        pending, timeout=remaining, return_when=FIRST_COMPLETED
+                    )
+                    if not finished:
+                        raise TimeoutError("computation of distance map timed out")
+                    previous = done
+                    for future in finished:
+                        done += future.result()
+                    _report_progress(progress, previous, done, n)
+            finally:
+                # shutdown(cancel_futures=True) needs Python 3.9
+                for future in pending:
+                    future.cancel()
+                pool.shutdown(wait=True)
+            matrix = np.ndarray(shape, dtype=self.dtype, buffer=memory.buf).copy()
+        finally:
+            memory.close()
+            memory.unlink()
+        return matrix
+
+    def get_distance(self, source, target):
+        i = self.index[source]
+        j = self.index[target]
+        if i < 0 or j < 0:
+            return float("inf")
+        d = self.matrix[i, j]
+        if d == self.unreachable:
+            return float("inf")
+        return float(d)
+
+
+# calls progress(done, total) whenever another tenth of the rows is done
+def _report_progress(progress, previous, done, total):
+    if progress is not None and previous * 10 // total != done * 10 // total:
+        progress(done, total)
+
+
+# state of a worker process of DistanceMatrix._compute_parallel
+_worker = {}
+
+
+def _initialize_worker(concrete, passable, cells, name, shape, dtype):
+    memory = shared_memory.SharedMemory(name=name)
+    _worker["memory"] = memory
+    _worker["matrix"] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+    _worker["search"] = WavefrontSearch(concrete, passable)
+    _worker["cells"] = cells
+    _worker["dtype"] = dtype
+
+
+def _compute_rows(start, stop):
+    cells = _worker["cells"]
+    _worker["matrix"][start:stop] = _worker["search"].distances_between(
+        cells[start:stop], cells, _worker["dtype"]
+    )
+    return stop - start
+
+
+# Shortest path distances between all pairs of free cells of a board. Free cells are
+# numbered in row-major order. The matrix is stored as a .npy file named after the
+# fingerprint of the board and memory-mapped when it is loaded again, so only the rows
+# that are used are read from disk.
+class AllPairsDistances(DistanceMatrix):
+    def __init__(self, board, directory=None, timeout=None, progress=None):
+        self.fingerprint = board_fingerprint(board)
+        free = ~board.concrete.astype(bool)
+        super().__init__(board, np.argwhere(free), compute=False)
+
+        path = None
+        if directory is not None:
+            path = os.path.join(directory, self.fingerprint + ".npy")
+        self.matrix = self._load(path)
+        if self.matrix is None:
+            self.matrix = self._compute(board, None, None, timeout, progress)
+            self._store(path)
+
+    def _load(self, path):
+        if path is None or not os.path.isfile(path):
+            return None
+        try:
+            matrix = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        n = len(self.cells)
+        if matrix.shape != (n, n) or matrix.dtype != self.dtype:
+            return None
+        return matrix
+
+    # Writes the matrix to a temporary file that is renamed, so that other processes
+    # never load a partially written matrix. The stored matrix is memory-mapped.
+    def _store(self, path):
+        if path is None:
+            return
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temporary, "wb") as f:
+                np.save(f, self.matrix)
+            os.replace(temporary, path)
+        except OSError:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return
+        self.matrix = np.load(path, mmap_mode="r")
+
+
+# returns the all-pairs distances of the board, which are shared by all callers
+def all_pairs_distances(board, timeout=None, progress=None):
+    fingerprint = board_fingerprint(board)
+    distances = _all_pairs_cache.get(fingerprint)
+    if distances is not None:
+        _all_pairs_cache.move_to_end(fingerprint)
+        return distances
+    distances = AllPairsDistances(
+        board, directory=DISTANCE_MATRIX_DIR, timeout=timeout, progress=progress
+    )
+    _all_pairs_cache[fingerprint] = distances
+    if len(_all_pairs_cache) > ALL_PAIRS_CACHE_SIZE:
+        _all_pairs_cache.popitem(last=False)
+    return distances
+
+
+# Distances between the given cells of a board that need memory linear in the number
+# of cells. The distances from a few landmarks to all cells are precomputed, and by the
+# triangle inequality |d(l, s) - d(l, t)| <= d(s, t) for every landmark l. The
+# landmarks are picked one after another as the cell farthest from the previous ones,
+# so that every connected component contains a landmark if there are enough of them.
+# Cells in different components are told apart by the landmarks that reach only one of
+# them. If exact is True, the exact distance is computed by a breadth first search from
+# the target instead, whose distance field is cached, since heuristics usually ask for
+# the distances to a few targets from many sources. No landmarks are needed then.
+class LandmarkDistances(DistanceOracle):
+    def __init__(self, board, cells, passable=None, landmarks=LANDMARKS, exact=False):
+        self.cells = np.asarray(cells, dtype=np.intp).reshape(-1, 2)
+        self.index = np.full(board.concrete.shape, -1, dtype=np.int32)
+        self.index[self.cells[:, 0], self.cells[:, 1]] = np.arange(len(self.cells))
+        self.exact = exact
+        self._search = WavefrontSearch(board.concrete, passable)
+        self._exact_distances = OrderedDict()
+
+        unreachable = np.iinfo(np.int32).max
+        distances = []
+        # distance of each cell to the closest landmark
+        closest = np.full(len(self.cells), unreachable, dtype=np.int64)
+        if exact:
+            landmarks = 0
+        for _ in range(min(landmarks, len(self.cells))):
+            landmark = self.cells[np.argmax(closest)]
+            d = self._search.distances_between(
+                landmark[np.newaxis], self.cells, np.uint32
+            )[0].astype(np.int64)
+            d[d == np.iinfo(np.uint32).max] = unreachable
+            distances.append(d)
+            np.minimum(closest, d, out=closest)
+            if not closest.any():
+                break
+        self.landmarks = np.array(distances, dtype=np.int32).reshape(
+            -1, len(self.cells)
+        )
+        self.unreachable = unreachable
+
+    def get_distance(self, source, target):
+        i = self.index[source]
+        j = self.index[target]
+        if i < 0 or j < 0:
+            return float("inf")
+        if self.exact:
+            return self._exact_distance(source, target)
+        if i == j:
+            return 0.0
+        a = self.landmarks[:, i]
+        b = self.landmarks[:, j]
+        reachable_a = a != self.unreachable
+        reachable_b = b != self.unreachable
+        if (reachable_a != reachable_b).any():
+            return float("inf")
+        both = reachable_a & reachable_b
+        if not both.any():
+            return 0.0
+        return float(np.abs(a[both] - b[both]).max())
+
+    def _exact_distance(self, source, target):
+        distances = self._exact_distances.get(target)
+        if distances is None:
+            distances = self._search.search([target])
+            self._exact_distances[target] = distances
+            if len(self._exact_distances) > EXACT_DISTANCE_CACHE_SIZE:
+                self._exact_distances.popitem(last=False)
+        else:
+            self._exact_distances.move_to_end(target)
+        return float(distances[self._search.index(*source)])
+
+
+# Returns the distances between the cells of the board, on paths through the passable
+# mask. All free cells are used if cells is None. A distance matrix is used if it fits
+# into MAX_DISTANCE_MATRIX_BYTES, and landmark distances otherwise. These are exact if
+# exact is True, and otherwise only lower bounds, which is enough for an admissible
+# heuristic and much cheaper.
+def distance_oracle(
+    board, cells=None, passable=None, timeout=None, progress=None, exact=True
+):
+    all_free_cells = cells is None and passable is None
+    if cells is None:
+        cells = np.argwhere(~board.concrete.astype(bool))
+    n = len(cells)
+    if n * n * np.dtype(np.uint16).itemsize > MAX_DISTANCE_MATRIX_BYTES:
+        return LandmarkDistances(board, cells, passable=passable, exact=exact)
+    if all_free_cells:
+        return all_pairs_distances(board, timeout=timeout, progress=progress)
+    return DistanceMatrix(
+        board, cells, passable=passable, timeout=timeout, progress=progress
+    )
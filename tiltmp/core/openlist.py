@@ -0,0 +1,155 @@
+import heapq
+from collections import deque
+from itertools import count
+
+# marks entries of an open list whose item was replaced or removed
+_REMOVED = object()
+
+
+# Priority queue for the open list of a search, which is only used by one thread and
+# therefore takes no locks. Of items with equal priorities the one added last is
+# returned first, so that searches follow their newest branch among equally good ones.
+# An item can be added under a key. Adding another item under the same key with a
+# priority that is not larger replaces the queued one (decrease-key): the old entry
+# stays in the heap, but is marked as removed and skipped when it comes up. The planners
+# only put a board again when they found a shorter path to it, so the new item is
+# preferred even if the priority is the same.
+class OpenList:
+    def __init__(self):
+        self._heap = []
+        # maps keys to the entries of the queued items
+        self._entries = {}
+        self._counter = count()
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def empty(self):
+        return self._size == 0
+
+    # Adds the item with the given priority. Returns False and leaves the queue
+    # unchanged if an item with the same key is queued with a smaller priority.
+    def put(self, priority, item, key=None):
+        if key is not None:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] < priority:
+                    return False
+                entry[2] = _REMOVED
+                self._size -= 1
+        # the counter decreases, so that newer entries come first on equal priorities
+        entry = [priority, -next(self._counter), item, key]
+        if key is not None:
+            self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+        self._size += 1
+        return True
+
+    # returns False if put would reject the item, since an item with the same key is
+    # queued with a smaller priority
+    def accepts(self, priority, key):
+        entry = self._entries.get(key)
+        return entry is None or priority <= entry[0]
+
+    # removes and returns the item with the smallest priority
+    def get(self):
+        heap = self._heap
+        while heap:
+            _, _, item, key = heapq.heappop(heap)
+            if item is _REMOVED:
+                continue
+            if key is not None:
+                del self._entries[key]
+            self._size -= 1
+            return item
+        raise IndexError("get from an empty open list")
+
+
+# Open list for integer priorities, which keeps a first in, first out bucket of entries
+# for every priority. Both put and get take constant time, apart from skipping over
+# empty buckets when the smallest priority increases. Items with an infinite priority
+# are returned after all others. Replacing items under a key works as in OpenList.
+class BucketQueue:
+    def __init__(self):
+        self._buckets = {}
+        self._infinite = deque()
+        # smallest priority of a queued item with a finite priority
+        self._min = 0
+        self._finite = 0
+        self._entries = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def empty(self):
+        return self._size == 0
+
+    # raises ValueError for priorities that are neither integers nor infinite, which
+    # would be put into the wrong bucket
+    def put(self, priority, item, key=None):
+        if priority != float("inf") and priority != int(priority):
+            raise ValueError("priority {!r} is not an integer".format(priority))
+        if key is not None:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] < priority:
+                    return False
+                self._discard(entry)
+        entry = [priority, item, key]
+        if key is not None:
+            self._entries[key] = entry
+        if priority == float("inf"):
+            self._infinite.append(entry)
+        else:
+            priority = int(priority)
+            if self._finite == 0:
+                # the buckets only contain removed entries
+                self._buckets.clear()
+                self._min = priority
+            elif priority < self._min:
+                self._min = priority
+            bucket = self._buckets.get(priority)
+            if bucket is None:
+                bucket = self._buckets[priority] = deque()
+            bucket.append(entry)
+            self._finite += 1
+        self._size += 1
+        return True
+
+    def accepts(self, priority, key):
+        entry = self._entries.get(key)
+        return entry is None or priority <= entry[0]
+
+    def _discard(self, entry):
+        entry[1] = _REMOVED
+        self._size -= 1
+        if entry[0] != float("inf"):
+            self._finite -= 1
+
+    def get(self):
+        if self._finite:
+            bucket = self._buckets.get(self._min)
+            while True:
+                if not bucket:
+                    self._buckets.pop(self._min, None)
+                    self._min += 1
+                    bucket = self._buckets.get(self._min)
+                    continue
+                entry = bucket.popleft()
+                if entry[1] is not _REMOVED:
+                    self._finite -= 1
+                    break
+        else:
+            while True:
+                if not self._infinite:
+                    raise IndexError("get from an empty open list")
+                entry = self._infinite.popleft()
+                if entry[1] is not _REMOVED:
+                    break
+        _, item, key = entry
+        if key is not None:
+            del self._entries[key]
+        self._size -= 1
+        return item
@@ -2,7 +2,6 @@ import json
 
 from tiltmp.mp.motionplanner import Instance
 from tiltmp.core.tumbletiles import *
-from copy import copy
 import numpy as np
 
 
@@ -14,9 +13,13 @@ class TileEncoder(json.JSONEncoder):
 
     @staticmethod
     def encode_tile(tile):
-        data = copy(tile.__dict__)
-        data.pop("parent")
-        return data
+        return {
+            "x": tile.x,
+            "y": tile.y,
+            "color": tile.color,
+            "glues": tile.glues,
+            "is_concrete": tile.is_concrete,
+        }
 
 
 def decode_tile(data):
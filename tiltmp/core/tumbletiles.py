@@ -1,8 +1,11 @@
 import functools
+import heapq
+from array import array
 from collections import namedtuple, deque, OrderedDict
 from enum import Enum
 from copy import deepcopy
 import inspect
+import random
 import numpy as np
 from tiltmp.core.gridutil import is_legal_index, direct_neighbors
 
@@ -84,6 +87,7 @@ def neighbor(p, direction):
 class GlueRules:
     def __init__(self):
         self._rules = set()
+        self._partner_sets = None
 
     @property
     def rules(self):
@@ -92,22 +96,52 @@ class GlueRules:
     def add_rule(self, rule):
         if len(rule) != 2:
             raise ValueError("Rules must be of length 2")
+        if tuple(rule) in self._rules:
+            return
         self._rules.add(tuple(rule))
         # rules are symmetrical
         self._rules.add(tuple(reversed(rule)))
+        self._partner_sets = None
 
     def remove_rule(self, rule):
         self._rules.remove(tuple(rule))
         self._rules.remove(tuple(reversed(rule)))
+        self._partner_sets = None
 
     def add_rules(self, rules):
         for rule in rules:
             self.add_rule(rule)
 
+    def copy(self):
+        rules = self.__class__()
+        rules._rules = set(self._rules)
+        rules._partner_sets = self._partner_sets
+        return rules
+
+    # Returns the glues that every glue sticks to, indexed by glue. A glue that sticks to
+    # nothing has no entry. The partners are cached until the rules change.
+    def _partners(self):
+        if self._partner_sets is None:
+            partners = {}
+            for glue1, glue2 in self._rules:
+                if glue1 is not None and glue2 is not None:
+                    partners.setdefault(glue1, set()).add(glue2)
+            self._partner_sets = {
+                glue: frozenset(glues) for glue, glues in partners.items()
+            }
+        return self._partner_sets
+
     def sticks(self, glue1, glue2):
-        if glue1 is None or glue2 is None:
-            return False
-        return (glue1, glue2) in self._rules
+        partners = self._partners().get(glue1)
+        return partners is not None and glue2 in partners
+
+    # like sticks, but never changes the rules
+    def would_stick(self, glue1, glue2):
+        return GlueRules.sticks(self, glue1, glue2)
+
+    # returns True iff the glue sticks to at least one glue
+    def sticks_to_anything(self, glue):
+        return glue in self._partners()
 
     def get_unique_rules(self):
         unique_rules = set()
@@ -133,13 +167,62 @@ class ReflexiveGlueRules(GlueRules):
             self.add_rule((glue1, glue2))
         return super().sticks(glue1, glue2)
 
+    def would_stick(self, glue1, glue2):
+        if glue1 == glue2 and glue1 is not None:
+            return True
+        return super().would_stick(glue1, glue2)
+
+    def sticks_to_anything(self, glue):
+        return glue is not None
+
 
 # Glues should be integers. 0 is reserved for no glue.
 Glues = namedtuple("Glues", ["N", "E", "S", "W"])
 
+# (dx, dy, index of the glue on the side, index of the glue on the opposite side) for the
+# sides of a tile, in the order of the fields of Glues
+_SIDES = ((0, -1, 0, 2), (1, 0, 1, 3), (0, 1, 2, 0), (-1, 0, 3, 1))
+
+
+# Compact, immutable board state. tiles is the tile table of the board, which is shared
+# between all states that have the same tiles. data packs an array with the coordinates of
+# the tiles, the index of the polyomino of every tile, and the positions and can_reach flags
+# of the polyominoes. Coordinates are packed as x * rows + y, so that they compare like
+# (x, y) tuples. hash is the Zobrist hash of the board, or None if it was not known.
+# settled is True if glues were activated after the last change of the board.
+BoardState = namedtuple("BoardState", ["tiles", "data", "hash", "settled"])
+
+
+# Zobrist keys of the board hash: maps glues to a list with a random 64 bit key for every
+# cell x * rows + y of a rows x cols board. The keys are seeded with the glues and the
+# board size, so they are the same on every board of that size and in every run.
+class ZobristTable(dict):
+    def __init__(self, rows, cols):
+        super().__init__()
+        self.rows = rows
+        self.cols = cols
+
+    def __missing__(self, glues):
+        rng = random.Random(repr((tuple(glues), self.rows, self.cols)))
+        keys = self[glues] = [rng.getrandbits(64) for _ in range(self.rows * self.cols)]
+        return keys
+
+
+_zobrist_tables = {}
+
+
+def zobrist_table(rows, cols):
+    table = _zobrist_tables.get((rows, cols))
+    if table is None:
+        table = _zobrist_tables[(rows, cols)] = ZobristTable(rows, cols)
+    return table
+
 
 # Class for individual tiles. Every tile on a board is part of a Polyomino.
+# Tiles and polyominoes are slotted, boards hold many of them and copy them often
 class Tile:
+    __slots__ = ("parent", "x", "y", "color", "glues", "is_concrete")
+
     def __init__(
         self,
         color="#FFFF00",
@@ -159,8 +242,21 @@ class Tile:
         self.x = x
         self.y = y
 
+    # returns a copy of the tile that is not part of any polyomino
+    def copy(self):
+        tile = Tile.__new__(Tile)
+        tile.parent = None
+        tile.x = self.x
+        tile.y = self.y
+        tile.color = self.color
+        tile.glues = self.glues
+        tile.is_concrete = self.is_concrete
+        return tile
+
 
 class Polyomino:
+    __slots__ = ("position", "tiles", "can_reach")
+
     # creates an empty polyomino with optional starting tiles
     def __init__(self, tiles=()):
         self.position = (float("inf"), float("inf"))
@@ -235,36 +331,18 @@ class Polyomino:
         if poly is None:
             return False
 
+        positions = {(pt.x, pt.y): pt for pt in poly.get_tiles()}
         for t in self.get_tiles():
-            for pt in poly.get_tiles():
-                # pt on left, t on right
-                if (
-                    t.x - pt.x == 1
-                    and t.y == pt.y
-                    and rules.sticks(t.glues.W, pt.glues.E)
-                ):
-                    return True
-                # t on left, pt on right
-                if (
-                    pt.x - t.x == 1
-                    and t.y == pt.y
-                    and rules.sticks(t.glues.E, pt.glues.W)
-                ):
-                    return True
-                # t on top, pt on bottom
-                if (
-                    t.x == pt.x
-                    and t.y - pt.y == -1
-                    and rules.sticks(t.glues.S, pt.glues.N)
-                ):
-                    return True
-                # pt on top, t on bottom
-                if (
-                    t.x == pt.x
-                    and pt.y - t.y == -1
-                    and rules.sticks(t.glues.N, pt.glues.S)
+            for direction in Direction:
+                glue = getattr(t.glues, direction.value)
+                if not rules.sticks_to_anything(glue):
+                    continue
+                pt = positions.get(neighbor((t.x, t.y), direction))
+                if pt is not None and rules.sticks(
+                    glue, getattr(pt.glues, direction.inverse().value)
                 ):
                     return True
+        return False
 
     def shape_equals(self, other):
         if self.size != other.size:
@@ -300,10 +378,82 @@ class Board:
         self.cols = cols
         # list of polyominoes
         self.polyominoes = []
+        self._obstacle_planes = None
         self.concrete = np.zeros(shape=(self.rows, self.cols), dtype=bool)
 
         # dictionary that will be used to find tiles based on their position on the board
         self._tile_at = {}
+        # tile order of the states returned by get_state
+        self._tile_table = None
+        # polyomino objects that are reused by restore_state
+        self._polyomino_pool = []
+        # Zobrist hash of the tiles, the XOR of the keys of all tiles. It is kept up to date
+        # while _hashed_tiles is the current _tile_at mapping, and recomputed otherwise.
+        self._hash = 0
+        self._hashed_tiles = None
+        # cells of the tiles that moved or were added since glues were last activated.
+        # Only their contacts have to be tested while _settled holds the current _tile_at
+        # mapping and polyomino list. Otherwise all contacts are tested.
+        self._dirty_cells = set()
+        self._settled = None
+
+    @property
+    def concrete(self):
+        return self._concrete
+
+    @concrete.setter
+    def concrete(self, concrete):
+        self._concrete = concrete
+        self._concrete_shared = False
+        self._obstacle_planes = None
+
+    # Copies the concrete before it is modified if it is shared with a clone
+    def _own_concrete(self):
+        if self._concrete_shared:
+            self.concrete = self._concrete.copy()
+
+    # Returns an independent copy of the board. Tiles and polyominoes are rebuilt in a
+    # single pass, while the concrete is shared until one of the boards modifies it.
+    def clone(self):
+        board = self.__class__.__new__(self.__class__)
+        board.__dict__.update(self.__dict__)
+        board.rectangles = list(self.rectangles)
+        board.glueText = list(self.glueText)
+        board.glue_rules = self.glue_rules.copy()
+        self._concrete_shared = board._concrete_shared = True
+
+        copies = {}
+        polyominoes = {}
+        for p in self.polyominoes:
+            if p in polyominoes:
+                continue
+            q = polyominoes[p] = Polyomino()
+            q.position = p.position
+            q.can_reach = p.can_reach
+            for position, tile in p.tiles.items():
+                t = copies[tile] = tile.copy()
+                t.parent = q
+                q.tiles[position] = t
+        board.polyominoes = [polyominoes[p] for p in self.polyominoes]
+        board._tile_at = {
+            position: copies[tile] for position, tile in self._tile_at.items()
+        }
+        if self._tile_table is not None:
+            board._tile_table = tuple(copies[tile] for tile in self._tile_table)
+        board._polyomino_pool = []
+        board._hashed_tiles = (
+            board._tile_at if self._hashed_tiles is self._tile_at else None
+        )
+        board._dirty_cells = set(self._dirty_cells)
+        settled = self._settled
+        board._settled = (
+            (board._tile_at, board.polyominoes)
+            if settled is not None
+            and settled[0] is self._tile_at
+            and settled[1] is self.polyominoes
+            else None
+        )
+        return board
 
     def number_of_tiles(self):
         return len(self._tile_at)
@@ -312,7 +462,14 @@ class Board:
         return self._tile_at.values()
 
     def __hash__(self):
-        return hash(tuple(sorted((t.x, t.y, t.glues) for t in self._tile_at.values())))
+        if self._hashed_tiles is not self._tile_at:
+            table = zobrist_table(self.rows, self.cols)
+            h = 0
+            for t in self._tile_at.values():
+                h ^= table[t.glues][t.x * self.rows + t.y]
+            self._hash = h
+            self._hashed_tiles = self._tile_at
+        return self._hash
 
     # returns true iff (x, y) contains concrete or is out of bounds
     def is_blocked(self, x, y):
@@ -332,14 +489,21 @@ class Board:
         tile = self.get_tile_at(x, y)
         if tile is None:
             if is_legal_index(self.concrete, (x, y)):
+                self._own_concrete()
                 self.concrete[x, y] = 0
+                self._obstacle_planes = None
             return
         # remove tile from the polyomino that it is in
         tile.parent.remove_tile_at(x, y)
         # if polyomino becomes empty, remove it
         if tile.parent.size == 0:
             self.polyominoes.remove(tile.parent)
-        self._tile_at[x, y] = None
+        self._tile_at.pop((x, y))
+        self._tile_table = None
+        if self._hashed_tiles is self._tile_at:
+            self._hash ^= zobrist_table(self.rows, self.cols)[tile.glues][
+                x * self.rows + y
+            ]
 
     def copy(self, selection=None):
         # TODO: Make this compatible with the new memory layout
@@ -372,13 +536,20 @@ class Board:
         for tile in p.get_tiles():
             self._tile_at[(tile.x, tile.y)] = tile
             self.polyominoes.append(p)
+            self._dirty_cells.add((tile.x, tile.y))
+            if self._hashed_tiles is self._tile_at:
+                keys = zobrist_table(self.rows, self.cols)[tile.glues]
+                self._hash ^= keys[tile.x * self.rows + tile.y]
+        self._tile_table = None
         return True
 
     def add_concrete(self, x, y):
         if self.is_occupied(x, y):
             return False
         else:
+            self._own_concrete()
             self.concrete[x, y] = True
+            self._obstacle_planes = None
 
     # Joins two polyominos, deletes the 2nd redundant polyomino, calls setGrid() to make the character grid
     # accurately represent the new polyominos.
@@ -440,7 +611,24 @@ class Board:
                             active.append(neighbor_poly)
         return connected_component
 
+    # Combines all polyominoes that are connected by glues that stick and returns the set
+    # of combined polyominoes. If the board was settled before, only the contacts of the
+    # tiles that moved or were added since then are tested.
     def activate_glues(self):
+        settled = self._settled
+        if (
+            settled is not None
+            and settled[0] is self._tile_at
+            and settled[1] is self.polyominoes
+        ):
+            changed = self._activate_new_glues(self._dirty_cells)
+        else:
+            changed = self._activate_all_glues()
+        self._dirty_cells = set()
+        self._settled = (self._tile_at, self.polyominoes)
+        return changed
+
+    def _activate_all_glues(self):
         remaining = set(self.polyominoes)
         changed = set()
         while remaining:
@@ -452,6 +640,59 @@ class Board:
                 changed.add(p)
         return changed
 
+    # Yields (tile, other tile, glue, other glue) for the tiles at the given cells and
+    # their neighbors in other polyominoes, with the glues that face each other. Glues
+    # that stick to nothing are skipped.
+    def _contacts(self, cells):
+        sticks_to_anything = self.glue_rules.sticks_to_anything
+        tile_at = self._tile_at
+        for x, y in cells:
+            tile = tile_at.get((x, y))
+            if tile is None:
+                continue
+            for dx, dy, side, opposite_side in _SIDES:
+                glue = tile.glues[side]
+                if not sticks_to_anything(glue):
+                    continue
+                other = tile_at.get((x + dx, y + dy))
+                if other is not None and other.parent is not tile.parent:
+                    yield tile, other, glue, other.glues[opposite_side]
+
+    # Tests the contacts of the tiles at the given cells and combines the polyominoes
+    # that stick together, using a union-find over the polyominoes.
+    def _activate_new_glues(self, cells):
+        root = {}
+
+        def find(p):
+            while p in root:
+                p = root[p]
+            return p
+
+        for tile, other, glue1, glue2 in self._contacts(cells):
+            if self.glue_rules.sticks(glue1, glue2):
+                a, b = find(tile.parent), find(other.parent)
+                if a is not b:
+                    root[b] = a
+        if not root:
+            return set()
+
+        components = {}
+        for p in root:
+            r = find(p)
+            components.setdefault(r, [r]).append(p)
+        changed = set()
+        combined = set()
+        for cc in components.values():
+            p = min(cc, key=lambda q: q.position)
+            for q in cc:
+                if q is not p:
+                    p.join(q)
+                    combined.add(q)
+            changed.add(p)
+        # remove the combined polyominoes with a single pass over the list
+        self.polyominoes[:] = [p for p in self.polyominoes if p not in combined]
+        return changed
+
     def _legal_index(self, x, y):
         return 0 <= x < self.cols or 0 <= y < self.rows
 
@@ -507,37 +748,171 @@ class Board:
 
     # moves all polyominoes at once
     def _move_polyominoes(self, polyominoes_list, dx, dy):
+        tile_at = self._tile_at
+        if self._hashed_tiles is tile_at:
+            # XOR the keys of the moved tiles out at their old and in at their new cells
+            table = zobrist_table(self.rows, self.cols)
+            rows = self.rows
+            shift = dx * rows + dy
+            h = self._hash
+            for p in polyominoes_list:
+                for tile in p.get_tiles():
+                    keys = table[tile.glues]
+                    i = tile.x * rows + tile.y
+                    h ^= keys[i] ^ keys[i + shift]
+            self._hash = h
         # remove current polyomino coordinates from the mapping
         for p in polyominoes_list:
             for tile in p.get_tiles():
-                self._tile_at.pop((tile.x, tile.y))
+                tile_at.pop((tile.x, tile.y))
         # set new positions for tiles
+        dirty = self._dirty_cells
         for p in polyominoes_list:
             p.move(dx, dy)
             for tile in p.get_tiles():
-                self._tile_at[(tile.x, tile.y)] = tile
+                tile_at[(tile.x, tile.y)] = tile
+                dirty.add((tile.x, tile.y))
+
+    # moves every polyomino by its own distance (in steps) in the direction (dx, dy)
+    def _slide_polyominoes(self, distances, dx, dy):
+        moves = [(p, d) for p, d in distances.items() if d]
+        tile_at = self._tile_at
+        if self._hashed_tiles is tile_at:
+            table = zobrist_table(self.rows, self.cols)
+            rows = self.rows
+            h = self._hash
+            for p, d in moves:
+                shift = d * (dx * rows + dy)
+                for tile in p.get_tiles():
+                    keys = table[tile.glues]
+                    i = tile.x * rows + tile.y
+                    h ^= keys[i] ^ keys[i + shift]
+            self._hash = h
+        for p, d in moves:
+            for tile in p.get_tiles():
+                tile_at.pop((tile.x, tile.y))
+        dirty = self._dirty_cells
+        for p, d in moves:
+            p.move(d * dx, d * dy)
+            for tile in p.get_tiles():
+                tile_at[(tile.x, tile.y)] = tile
+                dirty.add((tile.x, tile.y))
+
+    # The step engine works on bit-planes: every row of the board is packed into an
+    # integer, where bit x + 1 of plane y + 1 represents the cell (x, y). The outermost
+    # bits and planes stand for the walls, so shifted planes never leave the board.
+    # With vertical=True the planes hold the columns instead: bit y + 1 of plane x + 1.
+    def get_obstacle_planes(self, vertical=False):
+        if self._obstacle_planes is None:
+            self._obstacle_planes = {}
+        if vertical not in self._obstacle_planes:
+            length, lines = (
+                (self.rows, self.cols) if vertical else (self.cols, self.rows)
+            )
+            wall = (1 << (length + 2)) - 1
+            border = 1 | (1 << (length + 1))
+            concrete = self.concrete[: self.cols, : self.rows].astype(bool)
+            packed = np.packbits(
+                concrete if vertical else concrete.T, axis=1, bitorder="little"
+            )
+            planes = [wall]
+            for line in packed[:lines]:
+                planes.append((int.from_bytes(line.tobytes(), "little") << 1) | border)
+            planes.append(wall)
+            self._obstacle_planes[vertical] = planes
+        return self._obstacle_planes[vertical]
+
+    # returns the planes of all cells that are occupied by tiles. Empty planes are omitted
+    def get_occupancy_planes(self):
+        planes = {}
+        for x, y in self._tile_at:
+            planes[y + 1] = planes.get(y + 1, 0) | (2 << x)
+        return planes
+
+    # polyominoes that never move, regardless of the direction
+    def _fixed_polyominoes(self):
+        return ()
+
+    # returns the set of polyominoes that can move one step in the given direction
+    def _find_movable_polyominoes(self, direction, occupied=None):
+        dx, dy = direction.vector()
+        obstacles = self.get_obstacle_planes()
+        if occupied is None:
+            occupied = self.get_occupancy_planes()
+
+        blocked = set(self._fixed_polyominoes())
+        # tiles that are pushed directly against a wall or concrete
+        for y, bits in occupied.items():
+            ahead = obstacles[y + dy]
+            if dx == 1:
+                ahead >>= 1
+            elif dx == -1:
+                ahead <<= 1
+            hit = bits & ahead
+            while hit:
+                lowest = hit & -hit
+                blocked.add(self._tile_at[(lowest.bit_length() - 2, y - 1)].parent)
+                hit ^= lowest
+
+        if not blocked:
+            return set(self.polyominoes)
+
+        # everything that is stacked behind a blocked polyomino is blocked as well
+        active = deque(blocked)
+        while active:
+            p = active.popleft()
+            for tile in p.get_tiles():
+                behind = self._tile_at.get((tile.x - dx, tile.y - dy))
+                if behind is not None and behind.parent not in blocked:
+                    blocked.add(behind.parent)
+                    active.append(behind.parent)
+        return set(self.polyominoes).difference(blocked)
 
     def step(self, direction):
         direction = Direction(direction)
-        free_to_move = set(self.polyominoes)
-
-        # defines the condition for a wall depending on the direction
-        is_wall = {
-            Direction.N: (lambda board, x, y: y < 0),
-            Direction.W: (lambda board, x, y: x < 0),
-            Direction.S: (lambda board, x, y: y >= board.rows),
-            Direction.E: (lambda board, x, y: x >= board.cols),
-        }[direction]
-
-        for p in self.polyominoes:
-            if p in free_to_move and self.polyomino_is_blocked(p, direction, is_wall):
-                blocked = self._recursively_find_blocked_polyominoes(p, direction)
-                free_to_move.difference_update(blocked)
-
+        free_to_move = self._find_movable_polyominoes(direction)
         self._move_polyominoes(free_to_move, *direction.vector())
-
         return free_to_move
 
+    # Steps the board, which has to be in the given state, into its successor for every
+    # direction. The movable polyominoes of all directions are computed at once on the
+    # same occupancy planes. For every direction in which a step changes the board,
+    # (direction, moved polyominoes) is yielded while the board is in the successor
+    # configuration. When the generator is resumed, the board is reverted to the state,
+    # by moving the polyominoes back, or by restoring the state if polyominoes were
+    # combined in the meantime. Since restore_state reuses its polyomino objects, the
+    # polyominoes of the state stay the same objects in both cases.
+    def expand(self, state, directions=tuple(Direction)):
+        occupied = self.get_occupancy_planes()
+        successors = []
+        for direction in directions:
+            direction = Direction(direction)
+            free_to_move = self._find_movable_polyominoes(direction, occupied)
+            if free_to_move:
+                successors.append((direction, free_to_move))
+
+        polyominoes = self.polyominoes
+        number_of_polyominoes = len(polyominoes)
+        for direction, free_to_move in successors:
+            tile_at = self._tile_at
+            dx, dy = direction.vector()
+            self._move_polyominoes(free_to_move, dx, dy)
+            yield direction, free_to_move
+            if (
+                self._tile_at is tile_at
+                and self.polyominoes is polyominoes
+                and len(polyominoes) == number_of_polyominoes
+            ):
+                self._move_polyominoes(free_to_move, -dx, -dy)
+                # temporary polyominoes (e.g. in the heuristics) may have claimed tiles
+                for p in polyominoes:
+                    for tile in p.tiles.values():
+                        tile.parent = p
+            else:
+                self.restore_state(state)
+                polyominoes = self.polyominoes
+                number_of_polyominoes = len(polyominoes)
+
     # Removes all tiles from their current polyomino, then puts them each in their own
     # polyomino, and activates glues
     def relist_polyominoes(self):
@@ -568,30 +943,238 @@ class Board:
             self.add(Polyomino(tiles=[t]))
         self.activate_glues()
 
+    def _state_typecode(self):
+        return "H" if self.rows * self.cols <= 0x10000 else "I"
+
     def get_state(self):
-        return tuple(self._tile_at.items()), tuple(
-            p.get_state() for p in self.polyominoes
+        tiles = self._tile_table
+        if tiles is None or len(tiles) != len(self._tile_at):
+            tiles = self._tile_table = tuple(self._tile_at.values())
+        # Board.add lists a polyomino once for each of its tiles
+        polyominoes = list(dict.fromkeys(self.polyominoes))
+        # label tiles through the polyominoes rather than tile.parent, since
+        # temporary polyominoes (e.g. in the heuristics) may claim board tiles
+        label = {}
+        for i, p in enumerate(polyominoes):
+            x, y = p.position
+            for dx, dy in p.tiles:
+                label[(x + dx, y + dy)] = i
+        rows = self.rows
+        data = array(self._state_typecode())
+        data.extend(t.x * rows + t.y for t in tiles)
+        data.extend(label[(t.x, t.y)] for t in tiles)
+        data.extend(p.position[0] * rows + p.position[1] for p in polyominoes)
+        data.extend(1 if p.can_reach else 0 for p in polyominoes)
+        h = self._hash if self._hashed_tiles is self._tile_at else None
+        settled = self._settled
+        is_settled = (
+            settled is not None
+            and settled[0] is self._tile_at
+            and settled[1] is self.polyominoes
+            and not self._dirty_cells
         )
+        return BoardState(tiles, data.tobytes(), h, is_settled)
 
     def restore_state(self, state):
-        self.polyominoes = [Polyomino.restore_from_state(s) for s in state[1]]
-        self._tile_at = dict((k, v) for k, v in state[0])
-        for (x, y), tile in state[0]:
+        tiles, data, h, settled = state
+        n = len(tiles)
+        values = memoryview(data).cast(self._state_typecode())
+        number_of_polyominoes = (len(values) - 2 * n) // 2
+        pool = self._polyomino_pool
+        while len(pool) < number_of_polyominoes:
+            pool.append(Polyomino())
+        polyominoes = pool[:number_of_polyominoes]
+
+        rows = self.rows
+        offset = 2 * n
+        for i, p in enumerate(polyominoes):
+            p.position = divmod(values[offset + i], rows)
+            p.can_reach = bool(values[offset + number_of_polyominoes + i])
+            p.tiles = {}
+
+        tile_at = {}
+        for tile, coordinate, label in zip(tiles, values[:n], values[n:offset]):
+            x, y = divmod(coordinate, rows)
             tile.x, tile.y = x, y
+            p = polyominoes[label]
+            p.tiles[(x - p.position[0], y - p.position[1])] = tile
+            tile.parent = p
+            tile_at[(x, y)] = tile
+        self.polyominoes = polyominoes
+        self._tile_at = tile_at
+        self._tile_table = tiles
+        if h is not None:
+            self._hash = h
+            self._hashed_tiles = tile_at
+        self._dirty_cells = set()
+        self._settled = (tile_at, polyominoes) if settled else None
 
     def remap_tile_positions(self):
         self._tile_at = {}
+        self._tile_table = None
         for p in self.polyominoes:
             for tile in p.get_tiles():
                 self._tile_at[(tile.x, tile.y)] = tile
 
+    # Returns the tiles grouped by the lines along the direction, as
+    # {line: [(coordinate, tile), ...]}, sorted so that the frontmost tile comes last.
+    # Coordinates increase in the direction.
+    def _tiles_by_line(self, direction):
+        dx, dy = direction.vector()
+        lines = {}
+        for (x, y), tile in self._tile_at.items():
+            if dx:
+                lines.setdefault(y, []).append((x * dx, tile))
+            else:
+                lines.setdefault(x, []).append((y * dy, tile))
+        for line in lines.values():
+            line.sort(key=lambda entry: entry[0])
+        return lines
+
+    # Computes in closed form how many steps every polyomino moves when the board is tilted
+    # in the direction until nothing moves anymore (without activating glues). A
+    # polyomino either runs into concrete or a wall, or it comes to rest on a polyomino
+    # ahead of it after closing the gap between them. The distances are the shortest
+    # paths to the obstacles in this graph, which are found with Dijkstra's algorithm.
+    def _tumble_distances(self, direction, lines=None):
+        dx, dy = direction.vector()
+        vertical = dx == 0
+        forward = dx + dy
+        planes = self.get_obstacle_planes(vertical)
+        if lines is None:
+            lines = self._tiles_by_line(direction)
+
+        distance = {p: float("inf") for p in self.polyominoes}
+        for p in self._fixed_polyominoes():
+            distance[p] = 0
+        # resting_on[q] lists (p, gap) for the polyominoes p that can rest on q
+        resting_on = {}
+        for line, entries in lines.items():
+            plane = planes[line + 1]
+            for i, (c, tile) in enumerate(entries):
+                p = tile.parent
+                if i + 1 < len(entries):
+                    ahead_c, ahead = entries[i + 1]
+                    gap = ahead_c - c - 1
+                else:
+                    ahead, gap = None, float("inf")
+                # number of free cells in front of the tile, up to concrete or a wall
+                position = c * forward + 1
+                if forward > 0:
+                    obstacles = plane >> (position + 1)
+                    free = (obstacles & -obstacles).bit_length() - 1
+                else:
+                    free = position - (plane & ((1 << position) - 1)).bit_length()
+                if free < gap:
+                    if free < distance[p]:
+                        distance[p] = free
+                elif ahead.parent is not p:
+                    resting_on.setdefault(ahead.parent, []).append((p, gap))
+
+        heap = [(d, i, p) for i, (p, d) in enumerate(distance.items())]
+        heapq.heapify(heap)
+        counter = len(heap)
+        while heap:
+            d, _, q = heapq.heappop(heap)
+            if d > distance[q]:
+                continue
+            for p, gap in resting_on.get(q, ()):
+                if d + gap < distance[p]:
+                    distance[p] = d + gap
+                    heapq.heappush(heap, (d + gap, counter, p))
+                    counter += 1
+        return distance
+
+    # Returns the first step (1 <= step <= duration) of a tumble after which two tiles of
+    # different polyominoes are next to each other with glues that stick, or None. Only
+    # tiles in the same or in neighboring lines can touch. Their offset along the
+    # direction changes monotonically while exactly one of their polyominoes moves, so
+    # the steps at which they touch form an interval.
+    def _first_glue_contact(self, direction, distance, duration, lines):
+        # side of the first tile that faces the second one, for tiles in the same line
+        # and for tiles in the next line
+        if direction in (Direction.N, Direction.S):
+            sides = {0: direction, 1: Direction.E}
+        else:
+            sides = {0: direction, 1: Direction.S}
+
+        rules = self.glue_rules
+        contacts = []
+        for line, entries in lines.items():
+            for offset, side in sides.items():
+                other_entries = lines.get(line + offset)
+                if other_entries is None:
+                    continue
+                # offset along the direction at which the tiles touch
+                target = 1 if offset == 0 else 0
+                for i, (c1, t1) in enumerate(entries):
+                    glue1 = getattr(t1.glues, side.value)
+                    if not rules.sticks_to_anything(glue1):
+                        continue
+                    p1 = t1.parent
+                    d1 = distance[p1]
+                    # tiles in the same line can not pass each other
+                    if offset == 0:
+                        candidates = other_entries[i + 1 : i + 2]
+                    else:
+                        candidates = other_entries
+                    for c2, t2 in candidates:
+                        p2 = t2.parent
+                        glue2 = getattr(t2.glues, side.inverse().value)
+                        if p2 is p1 or not rules.sticks_to_anything(glue2):
+                            continue
+                        d2 = distance[p2]
+                        # the offset after step t is c2 - c1 + min(t, d2) - min(t, d1)
+                        low, high = min(d1, d2), max(d1, d2)
+                        k = target - (c2 - c1)
+                        if d1 > d2:
+                            k = -k
+                        if d1 == d2:
+                            if k != 0:
+                                continue
+                            start, end = 1, duration
+                        elif k == 0:
+                            start, end = 1, low
+                        elif 0 < k < high - low:
+                            start = end = low + k
+                        elif k == high - low:
+                            start, end = high, duration
+                        else:
+                            continue
+                        if start <= end:
+                            contacts.append((start, glue1, glue2))
+
+        contacts.sort(key=lambda contact: contact[0])
+        for step, glue1, glue2 in contacts:
+            if rules.would_stick(glue1, glue2):
+                return step
+        return None
+
+    # Tilts the board in the direction until nothing moves anymore. The slide distances are
+    # computed in closed form, which gives the same result as stepping repeatedly.
     def tumble(self, direction):
-        while self.step(direction):
-            pass
+        direction = Direction(direction)
+        self._slide_polyominoes(self._tumble_distances(direction), *direction.vector())
         self.activate_glues()
 
+    # Like tumble, but glues are activated after every step. Between two steps at which
+    # glues stick the polyominoes slide in closed form.
     def tumble_glue(self, direction):
-        while self.step(direction):
+        direction = Direction(direction)
+        dx, dy = direction.vector()
+        while True:
+            lines = self._tiles_by_line(direction)
+            distance = self._tumble_distances(direction, lines)
+            duration = max(distance.values(), default=0)
+            if duration == 0:
+                return
+            step = self._first_glue_contact(direction, distance, duration, lines)
+            if step is None:
+                self._slide_polyominoes(distance, dx, dy)
+                return
+            self._slide_polyominoes(
+                {p: min(d, step) for p, d in distance.items()}, dx, dy
+            )
             self.activate_glues()
 
 
@@ -604,6 +1187,11 @@ class FixedSeedTilesBoard(Board):
             super().__init__(*args, **kwargs)
         self.fixed_tiles = set()
 
+    def clone(self):
+        board = super().clone()
+        board.fixed_tiles = {board.get_tile_at(t.x, t.y) for t in self.fixed_tiles}
+        return board
+
     def add_fixed_tile(self, tile: Tile):
         p = Polyomino(tiles=[tile])
         if not self.add(p):
@@ -611,7 +1199,7 @@ class FixedSeedTilesBoard(Board):
         self.fixed_tiles.add(tile)
         return True
 
-    def activate_glues(self):
+    def _activate_all_glues(self):
         sticky_polyominoes = {t.parent for t in self.fixed_tiles}
         changed = set()
         while sticky_polyominoes:
@@ -623,31 +1211,20 @@ class FixedSeedTilesBoard(Board):
                 changed.add(p)
         return changed
 
-    def step(self, direction):
-        direction = Direction(direction)
-
-        fixed_polyominoes = {t.parent for t in self.fixed_tiles}
-        free_to_move = set(self.polyominoes)
-        free_to_move.difference_update(fixed_polyominoes)
-
-        # defines the condition for a wall depending on the direction
-        is_wall = {
-            Direction.N: (lambda board, x, y: y < 0),
-            Direction.W: (lambda board, x, y: x < 0),
-            Direction.S: (lambda board, x, y: y >= board.rows),
-            Direction.E: (lambda board, x, y: x >= board.cols),
-        }[direction]
-
-        for p in self.polyominoes:
+    # Only polyominoes that are connected to a fixed tile are combined. If none of the
+    # new contacts of a fixed polyomino sticks, nothing changes. Otherwise all glues are
+    # activated, since the polyominoes that join may already stick to others.
+    def _activate_new_glues(self, cells):
+        sticky_polyominoes = {t.parent for t in self.fixed_tiles}
+        for tile, other, glue1, glue2 in self._contacts(cells):
             if (
-                p in free_to_move and self.polyomino_is_blocked(p, direction, is_wall)
-            ) or p in fixed_polyominoes:
-                blocked = self._recursively_find_blocked_polyominoes(p, direction)
-                free_to_move.difference_update(blocked)
+                tile.parent in sticky_polyominoes or other.parent in sticky_polyominoes
+            ) and self.glue_rules.sticks(glue1, glue2):
+                return self._activate_all_glues()
+        return set()
 
-        self._move_polyominoes(free_to_move, *direction.vector())
-
-        return free_to_move
+    def _fixed_polyominoes(self):
+        return {t.parent for t in self.fixed_tiles}
 
     def remove_tile_or_concrete_at(self, x, y):
         self.fixed_tiles.discard(self.get_tile_at(x, y))
@@ -1626,7 +1626,7 @@ class tumblegui:
         if self.motion_planner_thread is not None:
             return
 
-        self.previous_boards.push(copy.deepcopy(self.board))
+        self.previous_boards.push(self.board.clone())
 
         if (
             direction != ""
@@ -17,13 +17,27 @@ from tiltmp.core.algorithms import (
     compute_distance_within_set,
     breadth_first_distance,
 )
+from tiltmp.core.distances import distance_oracle
 from tiltmp.core.gridutil import direct_neighbors
 from tiltmp.core.tumbletiles import Board, Polyomino, Tile
 
 PRE_COMPUTATION_TIMEOUT = 605.0
 
+# Boards too large for a distance matrix use exact distances computed on demand if
+# True, and the cheaper landmark lower bounds otherwise
+EXACT_DISTANCES = True
 
+
+def _print_progress(done, total):
+    print("precomputation: {}/{} sources".format(done, total))
+
+
+# Heuristics are called with the score of a board state and return its priority. Those
+# whose priorities are always integers set integral, so that planners can keep their
+# open list in a bucket queue.
 class DistanceBasedHeuristic(ABC):
+    integral = False
+
     def __init__(self, motion_planner, precomputed_distances=None):
         self._mp = motion_planner
         self._board = self._mp.board
@@ -51,6 +65,8 @@ class DistanceBasedHeuristic(ABC):
 
 
 class GreatestDistanceHeuristic(DistanceBasedHeuristic):
+    integral = True
+
     def __init__(self, motion_planner, **kwargs):
         super().__init__(motion_planner, kwargs)
 
@@ -88,6 +104,8 @@ class AverageDistanceAnchoringHeuristic(DistanceBasedHeuristic):
 
 
 class MaxXYDistancesHeuristic(DistanceBasedHeuristic):
+    integral = True
+
     def __init__(self, motion_planner, **kwargs):
         super().__init__(motion_planner, kwargs)
         self.left = min(t.x for t in self._target_shape.get_tiles())
@@ -184,6 +202,8 @@ class WeightedDistanceRepetitionPenaltyHeuristic(DistanceBasedHeuristic):
 
 # not admissible!
 class GreedyGreatestDistanceHeuristic(DistanceBasedHeuristic):
+    integral = True
+
     def __init__(self, motion_planner, **kwargs):
         super().__init__(motion_planner, kwargs)
 
@@ -234,6 +254,8 @@ class DistanceToNearestTile(DistanceBasedHeuristic):
 
 # heuristic for MovePolyominoToAreaMotionPlanner
 class DistancePolyominoToAreaHeuristic:
+    integral = True
+
     def __init__(self, mp):
         self.mp = mp
 
@@ -328,13 +350,19 @@ class DistanceToPolyominoAndTargetAreaHeuristic:
     @staticmethod
     def _compute_distance_map(board):
         t0 = time.time()
-        distances = {}
         target_area = DistanceToPolyominoAndTargetAreaHeuristic.target_area
-        for x, y in target_area:
-            if time.time() > t0 + PRE_COMPUTATION_TIMEOUT:
-                raise TimeoutError("computation of distance map timed out")
-            source = Polyomino(tiles=[Tile(position=(x, y))])
-            distances[(x, y)] = compute_distance_within_set(board, source, target_area)
+        cells = sorted(target_area)
+        inside = np.zeros(board.concrete.shape, dtype=bool)
+        if cells:
+            inside[tuple(zip(*cells))] = True
+        distances = distance_oracle(
+            board,
+            cells,
+            passable=inside,
+            timeout=PRE_COMPUTATION_TIMEOUT,
+            progress=_print_progress,
+            exact=EXACT_DISTANCES,
+        )
         print("precomputation done in: ", time.time() - t0)
         return distances
 
@@ -381,11 +409,10 @@ class DistanceToPolyominoAndTargetAreaHeuristic:
 
     def get_distance(self, tile: Polyomino, destination):
         minimum = float("inf")
-        distance_map = self._distances[tile.position]
         for coord in direct_neighbors(*destination):
             # destination can be in a wall
             if not self.mp.board.is_blocked(*coord):
-                d = distance_map[coord]
+                d = self._distances.get_distance(tile.position, coord)
                 if d < minimum:
                     minimum = d
         return minimum
@@ -393,6 +420,7 @@ class DistanceToPolyominoAndTargetAreaHeuristic:
 
 # heuristic for single tile motion planner
 class DistanceToPolyominoHeuristic:
+    integral = True
     distances = {}
 
     @staticmethod
@@ -404,15 +432,12 @@ class DistanceToPolyominoHeuristic:
     @staticmethod
     def _compute_distance_map(board):
         t0 = time.time()
-        distances = {}
-        for x in range(board.cols):
-            if time.time() > t0 + PRE_COMPUTATION_TIMEOUT:
-                raise TimeoutError("computation of distance map timed out")
-            for y in range(board.rows):
-                if board.is_blocked(x, y):
-                    continue
-                source = Polyomino(tiles=[Tile(position=(x, y))])
-                distances[(x, y)] = compute_distances(board, source)
+        distances = distance_oracle(
+            board,
+            timeout=PRE_COMPUTATION_TIMEOUT,
+            progress=_print_progress,
+            exact=EXACT_DISTANCES,
+        )
         print("precomputation done in: ", time.time() - t0)
         return distances
 
@@ -432,11 +457,10 @@ class DistanceToPolyominoHeuristic:
 
     def get_distance(self, tile: Polyomino, destination):
         minimum = float("inf")
-        distance_map = self._distances[tile.position]
         for coord in direct_neighbors(*destination):
             # destination can be in a wall
             if not self.mp.board.is_blocked(*coord):
-                d = distance_map[coord]
+                d = self._distances.get_distance(tile.position, coord)
                 if d < minimum:
                     minimum = d
         return minimum - 1
@@ -454,6 +478,7 @@ class DistanceToPolyominoHeuristic:
 
 # heuristic for single tile motion planner
 class GreedyDistanceToPolyominoHeuristic:
+    integral = True
     distances = {}
 
     @staticmethod
@@ -465,15 +490,12 @@ class GreedyDistanceToPolyominoHeuristic:
     @staticmethod
     def _compute_distance_map(board):
         t0 = time.time()
-        distances = {}
-        for x in range(board.cols):
-            if time.time() > t0 + PRE_COMPUTATION_TIMEOUT:
-                raise TimeoutError("computation of distance map timed out")
-            for y in range(board.rows):
-                if board.is_blocked(x, y):
-                    continue
-                source = Polyomino(tiles=[Tile(position=(x, y))])
-                distances[(x, y)] = compute_distances(board, source)
+        distances = distance_oracle(
+            board,
+            timeout=PRE_COMPUTATION_TIMEOUT,
+            progress=_print_progress,
+            exact=EXACT_DISTANCES,
+        )
         print("precomputation done in: ", time.time() - t0)
         return distances
 
@@ -495,11 +517,10 @@ class GreedyDistanceToPolyominoHeuristic:
 
     def get_distance(self, tile: Polyomino, destination):
         minimum = float("inf")
-        distance_map = self._distances[tile.position]
         for coord in direct_neighbors(*destination):
             # destination can be in a wall
             if not self.mp.board.is_blocked(*coord):
-                d = distance_map[coord]
+                d = self._distances.get_distance(tile.position, coord)
                 if d < minimum:
                     minimum = d
         return minimum
@@ -516,6 +537,8 @@ class GreedyDistanceToPolyominoHeuristic:
 
 
 class GreedyDistanceToFixedDestinationHeuristic:
+    integral = True
+
     @staticmethod
     def pre_computation(board, target_shape):
         pass
@@ -6,9 +6,12 @@ from abc import ABC, abstractmethod
 
 import tiltmp.core.tumbletiles as TT
 from tiltmp.core.algorithms import *
+from tiltmp.core.openlist import OpenList, BucketQueue
 from tiltmp.core.build_order import BuildOrderPlanner
 from tiltmp.mp.heuristic import *
+from tiltmp.mp.nodestore import NodeStore
 from tiltmp.mp.pruner import *
+from tiltmp.mp.stats import OPEN_LIST_SAMPLE_INTERVAL, SearchStats
 
 
 DIRECTIONS = tuple(Direction)
@@ -27,18 +30,15 @@ class Node:
         self.state = state
         self.candidate_moves = DIRECTIONS
 
-    # for use in priority queue
-    def __lt__(self, other):
-        return True
-
 
 class MotionPlanner(ABC):
     def __init__(self, instance: Instance):
         self.instance = instance
-        self.board = deepcopy(instance.initial_state)
+        self.board = instance.initial_state.clone()
         self.target_shape = instance.target_shape
         self._pruners = []
         self._stopped = False
+        self.stats = SearchStats()
 
     def stop(self):
         self._stopped = True
@@ -47,6 +47,24 @@ class MotionPlanner(ABC):
         self._pruners += [pruner]
         pruner.setup(self.board, self.target_shape)
 
+    # returns whether a pruner prunes the current board, and counts it for that pruner
+    def _is_pruned(self, changed):
+        t0 = time.perf_counter()
+        pruned = False
+        for pruner in self._pruners:
+            if pruner.is_prunable(changed):
+                self.stats.count_pruned(pruner)
+                pruned = True
+                break
+        self.stats.pruning_time += time.perf_counter() - t0
+        return pruned
+
+    def _activate_glues(self):
+        t0 = time.perf_counter()
+        changed = self.board.activate_glues()
+        self.stats.glue_time += time.perf_counter() - t0
+        return changed
+
     @abstractmethod
     def solve(self):
         pass
@@ -59,7 +77,6 @@ class MotionPlanner(ABC):
 class BFSMotionPlanner(MotionPlanner):
     def __init__(self, instance: Instance):
         super().__init__(instance)
-        self.board = deepcopy(instance.initial_state)
         self.target_shape = instance.target_shape
         self._pruners = []
         self._stop_condition = self._initial_stop_condition()
@@ -70,6 +87,8 @@ class BFSMotionPlanner(MotionPlanner):
         self._active_nodes = Queue()
         self._active_nodes.put(self._create_node(None))
         self._visited = set()
+        # tiles of the boards by their hash, if the stats verify hashes
+        self._tiles_by_hash = {}
 
     def _initial_stop_condition(self):
         if self.target_shape.size == len(self.board.get_tiles()) and not hasattr(
@@ -204,28 +223,54 @@ class BFSMotionPlanner(MotionPlanner):
     def get_solution_board(self):
         if self._solution_node is None:
             return None
-        b = deepcopy(self.board)
-        b.restore_state(self._solution_node.state)
-        return b
+        self.board.restore_state(self._solution_node.state)
+        return self.board.clone()
 
     def _expand(self, node):
-        for direction in DIRECTIONS:
-            self._load_node(node)
-            self._step(direction)
+        self._load_node(node)
+        self._expand_successors(node.state, DIRECTIONS)
         del self._current_node.state
 
+    def _open_list_size(self):
+        return self._active_nodes.qsize()
+
+    # calls _step for every successor of the loaded state in the given directions
+    def _expand_successors(self, state, directions):
+        stats = self.stats
+        stats.nodes_expanded += 1
+        if stats.nodes_expanded % OPEN_LIST_SAMPLE_INTERVAL == 0:
+            stats.sample_open_list(self._open_list_size())
+        t0 = time.perf_counter()
+        for direction, _ in self.board.expand(state, directions):
+            t1 = time.perf_counter()
+            stats.expand_time += t1 - t0
+            stats.nodes_generated += 1
+            if stats.verify_hashes:
+                self._verify_hash()
+            self._step(direction)
+            t0 = time.perf_counter()
+            stats.successor_time += t0 - t1
+        stats.expand_time += time.perf_counter() - t0
+
+    # counts a hash collision if a board with other tiles had the same hash before
+    def _verify_hash(self):
+        tiles = frozenset((xy, tile.glues) for xy, tile in self.board._tile_at.items())
+        if self._tiles_by_hash.setdefault(hash(self.board), tiles) != tiles:
+            self.stats.hash_collisions += 1
+
+    # handles the successor that the board was stepped into by Board.expand
     def _step(self, direction):
-        if self.board.step(direction.value):
-            h = hash(self.board)
-            if h in self._visited:
-                return
-            changed = self.board.activate_glues()
-            if any(pruner.is_prunable(changed) for pruner in self._pruners):
-                return
-            if self.is_finished():
-                self._solution_node = self._create_node(direction)
-            self._visited.add(h)
-            self._active_nodes.put(self._create_node(direction))
+        h = hash(self.board)
+        if h in self._visited:
+            self.stats.duplicates += 1
+            return
+        changed = self._activate_glues()
+        if self._is_pruned(changed):
+            return
+        if self.is_finished():
+            self._solution_node = self._create_node(direction)
+        self._visited.add(h)
+        self._active_nodes.put(self._create_node(direction))
 
     def extract_solution(self):
         return self._stop_condition.extract_solution()
@@ -248,10 +293,13 @@ class HeuristicMotionPlanner(BFSMotionPlanner):
         instance: Instance,
         heuristic=GreatestDistanceHeuristic,
         precomputed_distances=None,
+        node_store=None,
     ):
         super().__init__(instance)
         self.score = {hash(self.board): 0.0}
         self._current_score = 0
+        # keeps the queued nodes, which the open list refers to
+        self._nodes = NodeStore() if node_store is None else node_store
 
         if precomputed_distances is not None and issubclass(
             heuristic, DistanceBasedHeuristic
@@ -262,13 +310,28 @@ class HeuristicMotionPlanner(BFSMotionPlanner):
         else:
             self.heuristic = heuristic(self)
 
-        self._active_nodes = PriorityQueue()
+        self._active_nodes = self._create_open_list()
 
         first_node = self._create_node(None)
         self.best_node = first_node
-        self.best_heuristic_value = self.heuristic(0)
+        self.best_heuristic_value = self._evaluate(0)
+
+        self._active_nodes.put(self.best_heuristic_value, self._nodes.add(first_node))
+
+    # heuristics with integer priorities get a bucket queue
+    def _create_open_list(self):
+        if getattr(self.heuristic, "integral", False):
+            return BucketQueue()
+        return OpenList()
 
-        self._active_nodes.put((self.best_heuristic_value, first_node))
+    def _open_list_size(self):
+        return len(self._active_nodes)
+
+    def _evaluate(self, score):
+        t0 = time.perf_counter()
+        priority = self.heuristic(score)
+        self.stats.heuristic_time += time.perf_counter() - t0
+        return priority
 
     def _expand_reachable_set(self, node):
         self._load_node(node)
@@ -283,45 +346,69 @@ class HeuristicMotionPlanner(BFSMotionPlanner):
             s = previous_score + depth
             if s >= self.score.get(h, float("inf")):
                 continue
+            priority = self.heuristic(s)
+            if not self._active_nodes.accepts(priority, h):
+                continue
             self.score[h] = s
             n.state = self.board.get_state()
-            priority = self.heuristic(s)
-            self._active_nodes.put((priority, n))
+            self._active_nodes.put(priority, self._nodes.add(n), key=h)
             self._number_of_nodes += 1
 
     def get_best_node(self):
+        if self.best_node.state is None:
+            self._load_node(self.best_node)
         return self.best_node, self.best_heuristic_value
 
-    def _expand(self, node):
-        node = node[1]
-        self._current_score = None
-        for direction in node.candidate_moves:
-            self._load_node(node)
-            if self._current_score is None:
-                self._current_score = self.score[hash(self.board)]
-            self._step(direction)
+    # Node stores may drop the states of nodes, which are rebuilt by replaying the moves
+    # from the closest ancestor with a state. The pruners replay every move, since they
+    # set the can_reach flags of the polyominoes in _step. The board is restored from the
+    # rebuilt state afterwards, like from any other state.
+    def _load_node(self, node: Node):
+        if node.state is None:
+            moves = []
+            ancestor = node
+            while ancestor.state is None:
+                moves.append(ancestor.last_move)
+                ancestor = ancestor.parent
+            self.board.restore_state(ancestor.state)
+            for direction in reversed(moves):
+                self.board.step(direction)
+                changed = self.board.activate_glues()
+                for pruner in self._pruners:
+                    pruner.replay(changed)
+            node.state = self.board.get_state()
+        super()._load_node(node)
+
+    def _expand(self, ref):
+        node = self._nodes.load(ref)
+        self._load_node(node)
+        self._current_score = self.score[hash(self.board)]
+        self._expand_successors(node.state, node.candidate_moves)
         if node is not self.best_node:
-            del node.state
-            del node.candidate_moves
+            self._nodes.release(node)
 
     def _step(self, direction):
-        if not self.board.step(direction.value):
-            return  # step did not change anything
         h = hash(self.board)
         if self._current_score + 1 >= self.score.get(h, float("inf")):
+            self.stats.duplicates += 1
             return  # shorter path to this board state is known
-        changed = self.board.activate_glues()
-        if any(pruner.is_prunable(changed) for pruner in self._pruners):
+        changed = self._activate_glues()
+        if self._is_pruned(changed):
             self.score[h] = float("inf")
             return  # it can be proven that this branch can not lead to the solution
+        previous_score = self.score.get(h)
         self.score[h] = self._current_score + 1
         if self.is_finished():
             self._solution_node = self._create_node(direction)
-        priority = self.heuristic(self.score[h])
+        priority = self._evaluate(self.score[h])
         if priority == float("inf"):
             return
+        if not self._active_nodes.accepts(priority, h):
+            # the node that is queued for this board keeps its score
+            self.score[h] = previous_score
+            return
         n = self._create_node(direction)
-        self._active_nodes.put((priority, n))
+        self._active_nodes.put(priority, self._nodes.add(n), key=h)
 
         if priority < self.best_heuristic_value:
             self.best_node = n
@@ -340,8 +427,10 @@ class PolyominoToAreaMotionPlanner(HeuristicMotionPlanner):
             PolyominoToAreaMotionPlanner.PolyominoInAreaStopCondition(self)
         )
         self.heuristic = DistancePolyominoToAreaHeuristic(self)
-        self._active_nodes = PriorityQueue()
-        self._active_nodes.put((self.heuristic(0), self._create_node(None)))
+        self._active_nodes = self._create_open_list()
+        self._active_nodes.put(
+            self.heuristic(0), self._nodes.add(self._create_node(None))
+        )
 
     def _create_node(self, direction):
         node = super()._create_node(direction)
@@ -390,8 +479,10 @@ class SingleTileMotionPlanner(HeuristicMotionPlanner):
         self.add_pruner(WrongTilesCombinedPruner(self))
         if not hasattr(self.board, "fixed_tiles"):
             self.add_pruner(TargetUnreachablePruner(self))
-        self._active_nodes = PriorityQueue()
-        self._active_nodes.put((self.heuristic(0), self._create_node(None)))
+        self._active_nodes = self._create_open_list()
+        self._active_nodes.put(
+            self.heuristic(0), self._nodes.add(self._create_node(None))
+        )
 
     class TileAtDestination:
         def __init__(self, motion_planner):
@@ -438,6 +529,9 @@ class SingleTileMotionPlanner(HeuristicMotionPlanner):
             s = previous_score + depth
             if s >= self.score.get(h, float("inf")):
                 continue
+            priority = self.heuristic(s)
+            if not self._active_nodes.accepts(priority, h):
+                continue
             self.score[h] = s
             n.state = self.board.get_state()
             n.polyomino_position = (
@@ -445,8 +539,7 @@ class SingleTileMotionPlanner(HeuristicMotionPlanner):
                 node.polyomino_position[1] + dy,
             )
             n.tile_position = node.tile_position[0] + dx, node.tile_position[1] + dy
-            priority = self.heuristic(s)
-            self._active_nodes.put((priority, n))
+            self._active_nodes.put(priority, self._nodes.add(n), key=h)
             self._number_of_nodes += 1
 
     def _load_node(self, node: Node):
@@ -539,6 +632,7 @@ class OneTileAtATimeMotionPlanner(MotionPlanner):
             )
             solution = self.sub_motion_planner.solve()
             self.number_of_nodes += self.sub_motion_planner.number_of_nodes
+            self.stats.merge(self.sub_motion_planner.stats)
             if solution is None:
                 try:
                     self.next_build_order()
@@ -580,6 +674,7 @@ class OneTileAtATimeMotionPlanner(MotionPlanner):
 # expands the node to every edge of the reachable set
 def expand_reachable_set(board, polyomino, node):
     position, rel_coord = polyomino.get_shape()
+    fitting = fitting_positions(board, rel_coord)
     # maps position to previous position on the shortest path
     visited = {position}
     # (position, node, depth)
@@ -591,7 +686,7 @@ def expand_reachable_set(board, polyomino, node):
             xy = neighbor(current, direction)
             if xy in visited:
                 continue
-            if board.fits(xy, rel_coord):
+            if xy in fitting:
                 visited.add(xy)
                 n = Node(current_node, direction, None)
                 active.append((xy, n, depth + 1))
@@ -613,18 +708,21 @@ def get_anchoring_motion_planner(instance: Instance):
 
 
 def get_motion_planner(
-    instance: Instance, heuristic=GreatestDistanceHeuristic, precomputed_distances=None
+    instance: Instance,
+    heuristic=GreatestDistanceHeuristic,
+    precomputed_distances=None,
+    node_store=None,
 ):
+    mp = HeuristicMotionPlanner(
+        instance,
+        heuristic=heuristic,
+        precomputed_distances=precomputed_distances,
+        node_store=node_store,
+    )
     if instance.initial_state.number_of_tiles() == instance.target_shape.size:
-        mp = HeuristicMotionPlanner(
-            instance, heuristic=heuristic, precomputed_distances=precomputed_distances
-        )
         mp.add_pruner(NotEnoughTilesNoLeftoversPruner())
         mp.add_pruner(PackingNoLeftoversPruner(3))
     else:
-        mp = HeuristicMotionPlanner(
-            instance, heuristic=heuristic, precomputed_distances=precomputed_distances
-        )
         mp.add_pruner(NotEnoughTilesPruner())
         mp.add_pruner(PackingPruner())
     if hasattr(instance.initial_state, "fixed_tiles"):
@@ -0,0 +1,216 @@
+import mmap
+import pickle
+import struct
+import tempfile
+from collections import OrderedDict
+
+from tiltmp.core.tumbletiles import BoardState, Direction
+
+DIRECTIONS = tuple(Direction)
+
+# memory in bytes that a SpillingNodeStore uses for the nodes that it keeps in memory
+NODE_STORE_BUDGET = 256 << 20
+
+# estimated memory of a node in memory without its state data, used for the budget
+NODE_OVERHEAD = 400
+
+# size of the file of a SpillingNodeStore when it is created
+INITIAL_FILE_SIZE = 1 << 20
+
+# parent reference, hash, tile table, length of the state data and of the extra
+# attributes, last move, candidate moves and flags of a stored node
+_HEADER = struct.Struct("<qQIIIbBB")
+_HAS_HASH = 1
+_SETTLED = 2
+
+# attributes of nodes that are not pickled with the attributes added by planners
+_NODE_ATTRIBUTES = {
+    "parent",
+    "last_move",
+    "state",
+    "candidate_moves",
+    "ref",
+    "_store",
+    "_parent",
+}
+
+
+# Keeps the nodes of a search. Nodes are added when they are queued and loaded when
+# they are expanded, by a reference that the open list holds instead of the node. This
+# store keeps the nodes themselves in memory, and references are the nodes.
+class NodeStore:
+    def add(self, node):
+        return node
+
+    def load(self, ref):
+        return ref
+
+    # drops the state of an expanded node, which is only kept as a parent
+    def release(self, node):
+        del node.state
+        del node.candidate_moves
+
+
+# Node that was loaded from a SpillingNodeStore. Its parent is loaded from the store
+# when it is accessed, so that control sequences are found by following the parents.
+class StoredNode:
+    def __init__(self, store, ref, parent, last_move, state, candidate_moves):
+        self._store = store
+        self._parent = parent
+        self.ref = ref
+        self.last_move = last_move
+        self.state = state
+        self.candidate_moves = candidate_moves
+
+    @property
+    def parent(self):
+        if self._parent is None:
+            return None
+        return self._store.load(self._parent)
+
+
+# Store that writes every node to an append-only, memory-mapped file and keeps only
+# the most recently added nodes in memory, as long as they fit into the memory budget.
+# Nodes that are expanded next are usually among them, other nodes are read back from
+# the file. The reference of a node is its offset in the file, and stored nodes refer
+# to their parents by offset. Attributes that planners add to their nodes are pickled.
+class SpillingNodeStore(NodeStore):
+    def __init__(self, memory_budget=NODE_STORE_BUDGET, directory=None):
+        self.memory_budget = memory_budget
+        self._memory = 0
+        # maps references to the nodes in memory and their estimated memory
+        self._hot = OrderedDict()
+        # tile tables of the states, which are shared by many states
+        self._tile_tables = []
+        self._tile_table_index = {}
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._size = INITIAL_FILE_SIZE
+        self._file.truncate(self._size)
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+        self._end = 0
+
+    def close(self):
+        self._hot.clear()
+        self._map.close()
+        self._file.close()
+
+    @property
+    def file_size(self):
+        return self._end
+
+    def add(self, node):
+        ref = self._end
+        self._write(ref, node)
+        node.ref = ref
+        memory = NODE_OVERHEAD + len(node.state.data)
+        self._hot[ref] = node, memory
+        self._memory += memory
+        while self._memory > self.memory_budget and self._hot:
+            _, (_, evicted) = self._hot.popitem(last=False)
+            self._memory -= evicted
+        return ref
+
+    def load(self, ref):
+        hot = self._hot.get(ref)
+        if hot is not None:
+            return hot[0]
+        return self._read(ref)
+
+    def release(self, node):
+        hot = self._hot.pop(node.ref, None)
+        if hot is not None:
+            self._memory -= hot[1]
+
+    def _write(self, ref, node):
+        tiles, data, h, settled = node.state
+        table = self._tile_table_index.get(id(tiles))
+        if table is None:
+            table = len(self._tile_tables)
+            self._tile_tables.append(tiles)
+            self._tile_table_index[id(tiles)] = table
+        extra = {
+            name: value
+            for name, value in vars(node).items()
+            if name not in _NODE_ATTRIBUTES
+        }
+        extra = pickle.dumps(extra) if extra else b""
+        parent = -1 if node.parent is None else node.parent.ref
+        last_move = -1 if node.last_move is None else DIRECTIONS.index(node.last_move)
+        candidates = 0
+        for direction in node.candidate_moves:
+            candidates |= 1 << DIRECTIONS.index(direction)
+        flags = (_HAS_HASH if h is not None else 0) | (_SETTLED if settled else 0)
+        header = _HEADER.pack(
+            parent,
+            h or 0,
+            table,
+            len(data),
+            len(extra),
+            last_move,
+            candidates,
+            flags,
+        )
+        end = ref + len(header) + len(data) + len(extra)
+        self._reserve(end)
+        self._map[ref : ref + len(header)] = header
+        self._map[ref + len(header) : end - len(extra)] = data
+        self._map[end - len(extra) : end] = extra
+        self._end = end
+
+    def _reserve(self, end):
+        if end <= self._size:
+            return
+        while self._size < end:
+            self._size *= 2
+        self._map.close()
+        self._file.truncate(self._size)
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+
+    def _read(self, ref):
+        header = _HEADER.unpack_from(self._map, ref)
+        parent, h, table, length, extra_length, last_move, candidates, flags = header
+        start = ref + _HEADER.size
+        data = self._map[start : start + length]
+        state = BoardState(
+            self._tile_tables[table],
+            data,
+            h if flags & _HAS_HASH else None,
+            bool(flags & _SETTLED),
+        )
+        node = StoredNode(
+            self,
+            ref,
+            None if parent < 0 else parent,
+            None if last_move < 0 else DIRECTIONS[last_move],
+            state,
+            tuple(d for i, d in enumerate(DIRECTIONS) if candidates & 1 << i),
+        )
+        if extra_length:
+            extra = self._map[start + length : start + length + extra_length]
+            for name, value in pickle.loads(extra).items():
+                setattr(node, name, value)
+        return node
+
+
+# number of levels of the search tree between the nodes that keep their full state
+CHECKPOINT_INTERVAL = 8
+
+
+# Store that keeps the full state only for the nodes at every checkpoint_interval-th
+# level of the search tree. The other nodes keep just their parent and last move, and
+# the planner rebuilds their state by replaying the moves from the closest ancestor
+# that has one. The rebuilt state is dropped again when the node is released.
+class DeltaNodeStore(NodeStore):
+    def __init__(self, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.checkpoint_interval = checkpoint_interval
+
+    def add(self, node):
+        node.depth = 0 if node.parent is None else node.parent.depth + 1
+        if node.depth % self.checkpoint_interval:
+            node.state = None
+        return node
+
+    def release(self, node):
+        if node.depth % self.checkpoint_interval:
+            node.state = None
+        del node.candidate_moves
@@ -4,7 +4,12 @@ from copy import copy
 
 from typing import Set
 
-from tiltmp.core.algorithms import reachable_set, is_reachable_area, is_packable, fits
+from tiltmp.core.algorithms import (
+    reachable_set,
+    positions_reaching_area,
+    is_packable,
+    fits,
+)
 
 from tiltmp.core.tumbletiles import *
 
@@ -22,6 +27,11 @@ class Pruner(ABC):
     def is_prunable(self, changed):
         pass
 
+    # Called instead of is_prunable when a move that was not pruned is replayed, to
+    # update what the pruner keeps on the polyominoes of the board
+    def replay(self, changed):
+        pass
+
     def count_tiles(self):
         return sum(p.size for p in self.board.polyominoes if p.can_reach)
 
@@ -30,6 +40,9 @@ class NotEnoughTilesPruner(Pruner):
     def __init__(self):
         super().__init__()
         self.target_area = None
+        # maps the shape of a polyomino to the positions from which it reaches the target
+        # area
+        self._reaching = {}
 
     def setup(self, board: Board, target: Polyomino):
         super().setup(board, target)
@@ -37,9 +50,15 @@ class NotEnoughTilesPruner(Pruner):
         self.target_area = {
             (pos[0] + dx, pos[1] + dy) for dx, dy in self.target_shape.get_shape()[1]
         }
+        self._reaching = {}
 
     def _recompute_reachable(self, p: Polyomino):
-        p.can_reach = is_reachable_area(self.board, p, self.target_area)
+        shape = frozenset(p.get_shape()[1])
+        reaching = self._reaching.get(shape)
+        if reaching is None:
+            reaching = positions_reaching_area(self.board, shape, self.target_area)
+            self._reaching[shape] = reaching
+        p.can_reach = p.position in reaching
 
     def is_prunable(self, changed: Set[Polyomino]):
         for p in changed:
@@ -49,6 +68,11 @@ class NotEnoughTilesPruner(Pruner):
             return True
         return False
 
+    def replay(self, changed: Set[Polyomino]):
+        for p in changed:
+            if p.can_reach:
+                self._recompute_reachable(p)
+
 
 class NotEnoughTilesNoLeftoversPruner(NotEnoughTilesPruner):
     def is_prunable(self, changed: Set[Polyomino]):
@@ -58,6 +82,10 @@ class NotEnoughTilesNoLeftoversPruner(NotEnoughTilesPruner):
                 return True
         return False
 
+    def replay(self, changed: Set[Polyomino]):
+        for p in changed:
+            self._recompute_reachable(p)
+
 
 class PackingNoLeftoversPruner(Pruner):
     def __init__(self, n=3):
@@ -83,6 +111,11 @@ class PackingPruner(Pruner):
             return True
         return False
 
+    def replay(self, changed):
+        for p in changed:
+            if p.can_reach:
+                p.can_reach = fits(self.target_shape.get_shape()[1], p.get_shape()[1])
+
 
 class AnyTilesCombinedPruner(Pruner):
     def __init__(self, motion_planner):
@@ -3,12 +3,13 @@ import itertools
 import random
 from copy import copy, deepcopy
 import time
-from queue import PriorityQueue
 
 import numpy as np
 
 from tiltmp.core.algorithms import compute_distances
 from tiltmp.core.build_order import get_blueprint_with_glue_types
+from tiltmp.core.distances import distance_oracle
+from tiltmp.core.openlist import OpenList
 from tiltmp.core.serialization import read_instance
 from tiltmp.core.tumbletiles import Board, Polyomino, Direction, Tile
 from tiltmp.mp.heuristic import (
@@ -258,14 +259,15 @@ def greedy_bottleneck(config1, config2, max_bottleneck=float("inf")):
     def taxicab_distance(x, y):
         return abs(x[0] - y[0]) + abs(x[1] - y[1])
 
-    edge_queue = PriorityQueue()
+    edge_queue = OpenList()
     matched = set()
     edges = []
     for (p1, t1), (p2, t2) in itertools.product(
         config1.tiles.items(), config2.tiles.items()
     ):
         if t1.glues == t2.glues:
-            edge_queue.put((taxicab_distance(p1, p2), (p1, 1), (p2, 2)))
+            weight = taxicab_distance(p1, p2)
+            edge_queue.put(weight, (weight, p1, p2))
 
     needed = len(config1.tiles) * 2
     max_weight = 0
@@ -292,13 +294,7 @@ DISTANCES = None
 
 def _compute_distance_map(board):
     t0 = time.time()
-    distances = {}
-    for x in range(board.cols):
-        for y in range(board.rows):
-            if board.is_blocked(x, y):
-                continue
-            source = Polyomino(tiles=[Tile(position=(x, y))])
-            distances[(x, y)] = compute_distances(board, source)
+    distances = distance_oracle(board)
     print("precomputation done in: ", time.time() - t0)
     global DISTANCES
     DISTANCES = distances
@@ -385,6 +381,7 @@ class RRTSolver(MotionPlanner):
             precomputed_distances=self._target_distances,
         )
         solution = solver.solve(max_nodes=max_iterations)
+        self.stats.merge(solver.stats)
         if solution:
             solution_sequence = "".join(solution)
             solution_config = Configuration.from_board(solver.board)
@@ -406,6 +403,7 @@ class RRTSolver(MotionPlanner):
             precomputed_distances=self._target_distances,
         )
         solution = solver.solve(max_nodes=max_iterations)
+        self.stats.merge(solver.stats)
         if solution:
             solution_sequence = "".join(solution)
             solution_config = Configuration.from_board(solver.board)
@@ -460,7 +458,7 @@ class RRTSolver(MotionPlanner):
             config1,
             config2,
             max_bottleneck=max_bottleneck,
-            distance_func=lambda x, y: DISTANCES[x][y],
+            distance_func=DISTANCES.get_distance,
         )
 
     def distance_to_config_heuristic(self, config):
@@ -588,7 +586,7 @@ def construct_taxicab_distance_graph(config1, config2):
 
 def construct_real_distance_graph(config1, config2):
     def real_distance(x, y):
-        return DISTANCES[x][y]
+        return DISTANCES.get_distance(x, y)
 
     g = nx.Graph()
     top_nodes = [(p, 1) for p in config1.tiles.keys()]
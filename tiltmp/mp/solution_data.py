@@ -6,6 +6,7 @@ class SolutionData:
         runtime_profile="",
         instance=None,
         number_of_nodes=0,
+        stats=None,
     ):
         if instance:
             self.instance = instance
@@ -18,3 +19,5 @@ class SolutionData:
         self.timed_out = False
         if runtime_profile:
             self.runtime_profile = runtime_profile
+        if stats:
+            self.stats = stats
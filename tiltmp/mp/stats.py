@@ -0,0 +1,63 @@
+import os
+import time
+
+# number of expanded nodes between two samples of the size of the open list
+OPEN_LIST_SAMPLE_INTERVAL = 1000
+
+# Compare the tiles of boards with equal hashes to count hash collisions. This keeps
+# the tiles of every board that was generated, which is why it is off unless the
+# environment variable TILTMP_VERIFY_HASHES is set. Otherwise no collisions are counted.
+VERIFY_HASHES = bool(os.environ.get("TILTMP_VERIFY_HASHES"))
+
+
+# Counters and timers that the planners update while they search. Times are in
+# seconds. The expand time is spent on moving the tiles in Board.expand, the successor
+# time on handling the successors in the planner, which includes activating glues,
+# pruning and evaluating the heuristic.
+class SearchStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.nodes_generated = 0
+        self.nodes_expanded = 0
+        # successors whose board was already found by the search
+        self.duplicates = 0
+        # maps the class names of the pruners to the number of successors they pruned
+        self.nodes_pruned = {}
+        # hash collisions are only counted if verify_hashes is True
+        self.verify_hashes = VERIFY_HASHES
+        self.hash_collisions = 0
+        self.expand_time = 0.0
+        self.successor_time = 0.0
+        self.glue_time = 0.0
+        self.pruning_time = 0.0
+        self.heuristic_time = 0.0
+        # seconds since the start, number of expanded nodes and size of the open list
+        self.open_list_sizes = []
+
+    def count_pruned(self, pruner):
+        name = type(pruner).__name__
+        self.nodes_pruned[name] = self.nodes_pruned.get(name, 0) + 1
+
+    def sample_open_list(self, size):
+        seconds = time.perf_counter() - self.start
+        self.open_list_sizes.append([seconds, self.nodes_expanded, size])
+
+    # adds the counters and times of the search of a sub-planner, but not its samples
+    def merge(self, other):
+        self.nodes_generated += other.nodes_generated
+        self.nodes_expanded += other.nodes_expanded
+        self.duplicates += other.duplicates
+        for name, n in other.nodes_pruned.items():
+            self.nodes_pruned[name] = self.nodes_pruned.get(name, 0) + n
+        self.hash_collisions += other.hash_collisions
+        self.expand_time += other.expand_time
+        self.successor_time += other.successor_time
+        self.glue_time += other.glue_time
+        self.pruning_time += other.pruning_time
+        self.heuristic_time += other.heuristic_time
+
+    def to_dict(self):
+        data = {name: value for name, value in vars(self).items() if name != "start"}
+        data["nodes_pruned"] = dict(self.nodes_pruned)
+        data["open_list_sizes"] = list(self.open_list_sizes)
+        return data